@@ -1,20 +1,15 @@
 import os
 from datetime import datetime
-import openai
 import logging
 import re
 
-from app.config import Config
+from app.circuit_breaker import CircuitOpenError
+from app.llm import LLM
+from app.tracing import Tracer
 from app.models import FormatResponse
 
 logger = logging.getLogger(__name__)
 
-client = openai.OpenAI(
-    base_url=Config.OPENROUTER_BASE_URL,
-    api_key=Config.OPENROUTER_API_KEY
-)
-
-
 class ContentFormatter:
     """
     Агент форматирования. Делает ТОЛЬКО одно:
@@ -35,16 +30,14 @@ class ContentFormatter:
         prompt = ContentFormatter._build_prompt(content)
 
         try:
-            response = client.chat.completions.create(
-                model=Config.MODEL_NAME,
+            formatted = LLM.complete(
                 messages=[
                     {"role": "system", "content": "You are an editor of educational materials."},
                     {"role": "user", "content": prompt}
                 ],
+                agent="formatter",
                 temperature=0.1
-            )
-
-            formatted = response.choices[0].message.content.strip()
+            ).strip()
 
             # Save logs
             ContentFormatter._save_log(chapter_title, content, formatted)
@@ -54,11 +47,59 @@ class ContentFormatter:
 
             return FormatResponse(formatted_content=formatted)
 
+        except CircuitOpenError:
+            logger.warning("🔴 Провайдер недоступен → контент без форматирования")
+            return FormatResponse(formatted_content=content)
+
         except Exception as e:
             logger.error(f"❌ Ошибка форматирования: {e}")
             ContentFormatter._save_error(chapter_title, content, str(e))
             return FormatResponse(formatted_content=content)
 
+    @staticmethod
+    def repair_segment(
+        segment: str,
+        problem: str,
+        context_before: str = "",
+        context_after: str = "",
+        chapter_title: str = "unknown",
+    ) -> str:
+        """
+        Точечный ремонт: в LLM уходит только проблемный фрагмент и немного контекста.
+        При ошибке возвращает фрагмент без изменений.
+        """
+        logger.info(f"🔧 Ремонт фрагмента ({len(segment)} символов): {chapter_title}")
+
+        prompt = ContentFormatter._build_repair_prompt(segment, problem, context_before, context_after)
+
+        try:
+            repaired = LLM.complete(
+                messages=[
+                    {"role": "system", "content": "You are an editor of educational materials."},
+                    {"role": "user", "content": prompt}
+                ],
+                agent="formatter",
+                temperature=0.1,
+                max_tokens=max(256, len(segment)),
+            ).strip()
+
+            # Модель иногда оборачивает ответ в ```markdown … ```
+            wrapped = re.match(r"^```(?:markdown|md)\n([\s\S]*)\n```$", repaired)
+            if wrapped:
+                repaired = wrapped.group(1)
+
+            ContentFormatter._save_log(f"{chapter_title}_repair", segment, repaired)
+            return ContentFormatter._postprocess(repaired)
+
+        except CircuitOpenError:
+            logger.warning("🔴 Провайдер недоступен → фрагмент без ремонта")
+            return segment
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка ремонта фрагмента: {e}")
+            ContentFormatter._save_error(chapter_title, segment, str(e))
+            return segment
+
     # ================================================================
     # PROMPT BUILDER
     # ================================================================
@@ -105,10 +146,39 @@ class ContentFormatter:
         )
         return prompt
 
+    @staticmethod
+    def _build_repair_prompt(segment: str, problem: str, context_before: str, context_after: str) -> str:
+        prompt = (
+            "You are a strict Markdown repair assistant for educational content.\n"
+            "You receive ONE FRAGMENT of a lesson that has a formatting problem.\n"
+            "Your job is to:\n"
+            "1) Fix ONLY the problem described below inside the FRAGMENT.\n"
+            "2) Keep all other text of the fragment unchanged, in the same language.\n"
+            "3) Tables are NOT allowed: rewrite table rows as lists or plain sentences.\n"
+            "4) Characters | are allowed only inside LaTeX ($...$, $$...$$) or code blocks.\n"
+            "5) Every ``` code block and every $ / $$ formula must be properly closed.\n"
+            "6) NEVER put LaTeX inside code blocks. NEVER escape or duplicate backslashes.\n"
+            "7) If a formula is broken beyond recovery → remove it. NEVER invent math.\n"
+            "8) The CONTEXT is read-only: do NOT repeat it in the answer.\n"
+            "9) Output ONLY the fixed fragment, NO commentary, NO explanations.\n\n"
+
+            f"PROBLEM: {problem}\n\n"
+
+            "===== CONTEXT BEFORE (read-only) =====\n"
+            f"{context_before}\n"
+            "===== FRAGMENT =====\n"
+            f"{segment}\n"
+            "===== CONTEXT AFTER (read-only) =====\n"
+            f"{context_after}\n"
+            "===== END =====\n"
+        )
+        return prompt
+
     # ================================================================
     # POSTPROCESSING — максимально аккуратный, безопасный
     # ================================================================
     @staticmethod
+    @Tracer.traced("formatter.postprocess")
     def _postprocess(md: str) -> str:
         # Удаляем HTML
         md = re.sub(r"<[^>]+>", "", md)
@@ -171,6 +241,7 @@ class ContentFormatter:
     # LOGGING
     # ================================================================
     @staticmethod
+    @Tracer.traced("disk.save_log")
     def _save_log(chapter: str, original: str, formatted: str):
         directory = "content_logs/formatter"
         os.makedirs(directory, exist_ok=True)
@@ -186,6 +257,7 @@ class ContentFormatter:
             f.write(formatted)
 
     @staticmethod
+    @Tracer.traced("disk.save_error")
     def _save_error(chapter: str, content: str, error: str):
         directory = "content_logs/errors"
         os.makedirs(directory, exist_ok=True)
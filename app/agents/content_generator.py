@@ -1,26 +1,41 @@
 import traceback
 
-import openai
+import contextvars
 import json
 import logging
 import re
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import List, NamedTuple, Optional, Tuple
 
-from app.config import Config
+from app.circuit_breaker import CircuitOpenError
+from app.llm import LLM
 from app.models import LessonContent, Chapter
 from app.agents.content_formatter import ContentFormatter
+from app.config import Config
+from app.renderer import LessonRenderer
+from app.tracing import Tracer
+from app.usage import Usage
 
 logger = logging.getLogger(__name__)
 
-client = openai.OpenAI(
-    base_url=Config.OPENROUTER_BASE_URL,
-    api_key=Config.OPENROUTER_API_KEY
-)
 
+class Defect(NamedTuple):
+    """Проблемный фрагмент урока: строки [start, end) и описание проблемы."""
+    start: int
+    end: int
+    problem: str
 
 class ContentGenerator:
 
+    SYSTEM_PROMPT = (
+        "You are an AI that generates educational content. "
+        "Output must be STRICTLY VALID JSON. "
+        "Absolutely NO text outside the JSON object. "
+        "Follow all instructions exactly."
+    )
+
     # ================================================================
     # PUBLIC API
     # ================================================================
@@ -32,22 +47,41 @@ class ContentGenerator:
         2) Отправляет контент в ContentFormatter.
         3) Проверяет качество форматирования.
         4) Перезапрашивает форматирование до идеального результата.
+        5) (опционально) Пререндерит Markdown + LaTeX в HTML.
+        В режиме SECTIONED_LESSONS шаги 1–4 выполняются для каждого раздела
+        главы параллельно (см. _generate_sectioned).
         """
 
         logger.info(f"📘 Генерация контента для главы: {chapter.title}")
 
-        raw_json = ContentGenerator._generate_json_with_retries(chapter, max_retries)
+        sectioned = ContentGenerator._generate_sectioned(chapter, max_retries) if Config.SECTIONED_LESSONS else None
 
-        logger.info("🎨 Форматируем контент…")
-        formatted_content = ContentGenerator._format_until_valid(
-            raw_json["content"],
-            chapter_title=chapter.title
-        )
+        if sectioned is not None:
+            chapter_title = chapter.title
+            formatted_content, fallback = sectioned
+        else:
+            raw_json = ContentGenerator._generate_json_with_retries(chapter, max_retries)
+            chapter_title = raw_json["chapter_title"]
+            fallback = raw_json.get("fallback", False)
+
+            logger.info("🎨 Форматируем контент…")
+            formatted_content = ContentGenerator._format_until_valid(
+                raw_json["content"],
+                chapter_title=chapter.title
+            )
+
+        html, render_issues = None, []
+        if Config.PRERENDER_HTML:
+            logger.info("🖼 Пререндер урока в HTML…")
+            html, render_issues = LessonRenderer.render(formatted_content)
 
         return LessonContent(
-            chapter_title=raw_json["chapter_title"],
+            chapter_title=chapter_title,
             content=formatted_content,
             key_points=[],
+            html=html,
+            render_issues=render_issues,
+            fallback=fallback,
         )
 
     # ================================================================
@@ -59,41 +93,140 @@ class ContentGenerator:
             try:
                 prompt = ContentGenerator._create_prompt(chapter)
 
-                response = client.chat.completions.create(
-                    model=Config.MODEL_NAME,
+                content = LLM.complete(
                     messages=[
-                        {
-                            "role": "system",
-                            "content": (
-                                "You are an AI that generates educational content. "
-                                "Output must be STRICTLY VALID JSON. "
-                                "Absolutely NO text outside the JSON object. "
-                                "Follow all instructions exactly."
-                            )
-                        },
+                        {"role": "system", "content": ContentGenerator.SYSTEM_PROMPT},
                         {"role": "user", "content": prompt}
                     ],
+                    agent="content",
+                    attempt=attempt,
+                    validate=ContentGenerator._parse_lesson_json,
                     temperature=0.2 if attempt == 0 else 0.1,
                     max_tokens=2000,
                     response_format={"type": "json_object"}
                 )
 
-                content = response.choices[0].message.content
                 ContentGenerator._save_raw("json", content, chapter.title, attempt)
 
-                data = json.loads(content)
-                ContentGenerator._validate_json_structure(data)
+                return ContentGenerator._parse_lesson_json(content)
 
-                return data
+            except CircuitOpenError:
+                logger.warning("🔴 Провайдер недоступен → без повторных попыток")
+                break
 
             except Exception as e:
                 logger.error(f"❌ Ошибка генерации JSON (попытка {attempt}): {e}")
                 if attempt == max_retries:
                     break
+                if Usage.budget_exhausted():
+                    logger.warning("💰 Бюджет курса исчерпан → без повторных попыток")
+                    break
 
         logger.warning("⚠ JSON так и не удалось сгенерировать корректно → fallback")
         return ContentGenerator._fallback_json(chapter)
 
+    # ================================================================
+    # STEP 1 (SECTIONED) — ПЛАН РАЗДЕЛОВ + ПАРАЛЛЕЛЬНАЯ ГЕНЕРАЦИЯ
+    # ================================================================
+    @staticmethod
+    def _generate_sectioned(chapter: Chapter, max_retries: int) -> Optional[Tuple[str, bool]]:
+        """
+        Сначала короткий план разделов главы, затем все разделы генерируются
+        и форматируются параллельно, каждый со своими попытками и проверкой.
+        Задержка главы ограничена самым медленным разделом, а не её длиной.
+        Возвращает (Markdown, есть ли разделы-заглушки) или None,
+        если план получить не удалось.
+        """
+        sections = ContentGenerator._generate_section_plan(chapter, max_retries)
+        if not sections:
+            logger.warning("⚠ План разделов не получен → генерация главы одним запросом")
+            return None
+
+        logger.info(f"🧩 Глава '{chapter.title}': {len(sections)} разделов, генерируем параллельно")
+        titles = [section["title"] for section in sections]
+
+        def build(section: dict) -> Tuple[str, bool]:
+            with Tracer.span("section", title=section["title"]):
+                content = ContentGenerator._generate_section_with_retries(chapter, section, titles, max_retries)
+                if content is None:
+                    return f"{section['focus']}\n\nМатериал раздела временно недоступен.", True
+                return ContentGenerator._format_until_valid(
+                    content,
+                    chapter_title=f"{chapter.title} — {section['title']}"
+                ), False
+
+        # Каждому потоку — своя копия контекста: расход токенов идёт в Usage-scope курса
+        contexts = [contextvars.copy_context() for _ in sections]
+        with ThreadPoolExecutor(max_workers=Config.SECTION_MAX_PARALLEL, thread_name_prefix="section") as pool:
+            results = list(pool.map(lambda context, section: context.run(build, section), contexts, sections))
+
+        parts = [f"# {chapter.title}"]
+        for section, (body, _) in zip(sections, results):
+            parts.append(f"## {section['title']}\n\n{body}")
+        return "\n\n".join(parts), any(fallback for _, fallback in results)
+
+    @staticmethod
+    def _generate_section_plan(chapter: Chapter, max_retries: int) -> List[dict]:
+        for attempt in range(max_retries + 1):
+            try:
+                content = LLM.complete(
+                    messages=[
+                        {"role": "system", "content": ContentGenerator.SYSTEM_PROMPT},
+                        {"role": "user", "content": ContentGenerator._create_plan_prompt(chapter)}
+                    ],
+                    agent="content",
+                    attempt=attempt,
+                    validate=ContentGenerator._parse_section_plan,
+                    temperature=0.2 if attempt == 0 else 0.1,
+                    max_tokens=500,
+                    response_format={"type": "json_object"}
+                )
+                ContentGenerator._save_raw("plan", content, chapter.title, attempt)
+
+                return ContentGenerator._parse_section_plan(content)[:Config.SECTION_MAX_COUNT]
+
+            except CircuitOpenError:
+                logger.warning("🔴 Провайдер недоступен → без повторных попыток")
+                break
+
+            except Exception as e:
+                logger.error(f"❌ Ошибка генерации плана разделов (попытка {attempt}): {e}")
+
+        return []
+
+    @staticmethod
+    def _generate_section_with_retries(chapter: Chapter, section: dict, titles: List[str], max_retries: int) -> Optional[str]:
+        for attempt in range(max_retries + 1):
+            try:
+                content = LLM.complete(
+                    messages=[
+                        {"role": "system", "content": ContentGenerator.SYSTEM_PROMPT},
+                        {"role": "user", "content": ContentGenerator._create_section_prompt(chapter, section, titles)}
+                    ],
+                    agent="content",
+                    attempt=attempt,
+                    validate=ContentGenerator._parse_section,
+                    temperature=0.2 if attempt == 0 else 0.1,
+                    max_tokens=Config.SECTION_MAX_TOKENS,
+                    response_format={"type": "json_object"}
+                )
+                ContentGenerator._save_raw("section", content, f"{chapter.title}_{section['title']}", attempt)
+
+                return ContentGenerator._parse_section(content)
+
+            except CircuitOpenError:
+                logger.warning("🔴 Провайдер недоступен → без повторных попыток")
+                break
+
+            except Exception as e:
+                logger.error(f"❌ Ошибка генерации раздела '{section['title']}' (попытка {attempt}): {e}")
+                if Usage.budget_exhausted():
+                    logger.warning("💰 Бюджет курса исчерпан → без повторных попыток")
+                    break
+
+        logger.warning(f"⚠ Раздел '{section['title']}' так и не удалось сгенерировать → fallback")
+        return None
+
     # ================================================================
     # STEP 2 — МНОГОКРАТНОЕ ФОРМАТИРОВАНИЕ ПОКА НЕ БУДЕТ КАЧЕСТВЕННО
     # ================================================================
@@ -101,11 +234,29 @@ class ContentGenerator:
     def _format_until_valid(text: str, chapter_title: str, passes: int = 10) -> str:
         """
         Форматирует контент до идеального состояния.
+        Первый проход — форматирование всего урока, дальше (SEGMENT_REPAIR)
+        чинятся только проблемные фрагменты. Дополнительные проходы
+        не выполняются, если бюджет курса исчерпан.
         Логирует все причины повторного форматирования.
         """
         for attempt in range(passes):
+            # Провайдер недоступен — дальнейшие проходы ничего не изменят
+            if not LLM.available():
+                logger.warning("🔴 Провайдер недоступен → прекращаем форматирование")
+                break
+
+            # Бюджет курса исчерпан — обходимся без дополнительных проходов
+            if attempt > 0 and Usage.budget_exhausted():
+                logger.warning("💰 Бюджет курса исчерпан → прекращаем форматирование")
+                break
+
             try:
-                formatted = ContentFormatter.format_content(text, chapter_title).formatted_content
+                repair = attempt > 0 and Config.SEGMENT_REPAIR
+                with Tracer.span("format.attempt", attempt=attempt + 1, repair=repair):
+                    if repair:
+                        formatted = ContentGenerator._repair_defects(text, chapter_title)
+                    else:
+                        formatted = ContentFormatter.format_content(text, chapter_title).formatted_content
 
                 logger.info(f"🎨 Попытка {attempt + 1} форматирования ({chapter_title})")
                 logger.info(f"Длина текста: {len(formatted)} символов")
@@ -130,10 +281,148 @@ class ContentGenerator:
         logger.error("❌ Контент так и не удалось идеально отформатировать → отдаём последний вариант")
         return text
 
+    # ================================================================
+    # STEP 2a — ТОЧЕЧНЫЙ РЕМОНТ ФРАГМЕНТОВ
+    # ================================================================
+    @staticmethod
+    def _repair_defects(text: str, chapter_title: str) -> str:
+        """
+        Отправляет в форматтер только проблемные фрагменты (с небольшим контекстом)
+        и вклеивает исправленные куски обратно. Стоимость ремонта зависит
+        от размера дефекта, а не от длины урока.
+        """
+        defects = ContentGenerator._find_defects(text)
+        if not defects:
+            # Валидатор недоволен, но локализовать проблему не удалось → полный проход
+            logger.info("🎨 Дефекты не локализованы → полное форматирование")
+            return ContentFormatter.format_content(text, chapter_title).formatted_content
+
+        lines = text.split("\n")
+        context = Config.REPAIR_CONTEXT_LINES
+        logger.info(f"🔧 Найдено фрагментов для ремонта: {len(defects)}")
+
+        # С конца, чтобы номера строк ещё не обработанных фрагментов не сдвигались
+        for defect in reversed(defects):
+            segment = "\n".join(lines[defect.start:defect.end])
+            repaired = ContentFormatter.repair_segment(
+                segment,
+                defect.problem,
+                context_before="\n".join(lines[max(0, defect.start - context):defect.start]),
+                context_after="\n".join(lines[defect.end:defect.end + context]),
+                chapter_title=chapter_title,
+            )
+            lines[defect.start:defect.end] = repaired.split("\n") if repaired else []
+
+        return "\n".join(lines)
+
+    @staticmethod
+    @Tracer.traced("validate.find_defects")
+    def _find_defects(text: str) -> List[Defect]:
+        """
+        Находит фрагменты с проблемами форматирования:
+        → незакрытый блок кода ```
+        → незакрытая формула $$…$$
+        → символы | вне формул и кода (таблицы) — ровно там, где их видит _is_content_valid
+        Пересекающиеся и соседние фрагменты объединяются.
+        """
+        lines = text.split("\n")
+        max_lines = Config.REPAIR_MAX_SEGMENT_LINES
+        defects: List[Defect] = []
+
+        def block_end(start: int) -> int:
+            # Фрагмент до пустой строки/заголовка, но не длиннее max_lines
+            end = start + 1
+            while end < len(lines) and end - start < max_lines:
+                if not lines[end].strip() or lines[end].lstrip().startswith("#"):
+                    break
+                end += 1
+            return end
+
+        fence_start = None
+        display_start = None
+
+        for i, line in enumerate(lines):
+            # Блоки кода
+            if line.strip().startswith("```"):
+                fence_start = i if fence_start is None else None
+                continue
+            if fence_start is not None:
+                continue
+
+            # Display-формулы $$…$$ (могут занимать несколько строк)
+            display_marks = line.replace("\\$", "").count("$$")
+            if display_start is not None:
+                if display_marks % 2 == 1:
+                    display_start = None
+                continue
+            if display_marks % 2 == 1:
+                display_start = i
+
+        # | вне формул — таблица или «сырые» модули чисел
+        for i, line in enumerate(ContentGenerator._outside_math_and_code(text).split("\n")):
+            if "|" in line:
+                defects.append(Defect(i, i + 1, "Символы | вне формул и кода: таблицы запрещены"))
+
+        if fence_start is not None:
+            defects.append(Defect(fence_start, block_end(fence_start), "Незакрытый блок кода ```"))
+        if display_start is not None:
+            defects.append(Defect(display_start, block_end(display_start), "Незакрытая формула $$…$$"))
+
+        # Объединяем пересекающиеся и соседние фрагменты
+        merged: List[Defect] = []
+        for defect in sorted(defects):
+            if merged and defect.start <= merged[-1].end:
+                last = merged[-1]
+                problems = last.problem if defect.problem in last.problem else f"{last.problem}; {defect.problem}"
+                merged[-1] = Defect(last.start, max(last.end, defect.end), problems)
+            else:
+                merged.append(defect)
+        return merged
+
     # ================================================================
     # VALIDATION
     # ================================================================
     @staticmethod
+    def _outside_math_and_code(text: str) -> str:
+        """
+        Текст без LaTeX-формул и блоков кода. Вырезанное заменяется переводами строк,
+        чтобы номера строк совпадали с исходным текстом.
+        """
+        def blank(match: re.Match) -> str:
+            return "\n" * match.group(0).count("\n")
+
+        cleaned = re.sub(r"\$\$.*?\$\$", blank, text, flags=re.DOTALL)
+        cleaned = re.sub(r"\$.*?\$", blank, cleaned, flags=re.DOTALL)
+        return re.sub(r"```.*?```", blank, cleaned, flags=re.DOTALL)
+
+    @staticmethod
+    def _parse_lesson_json(content: str) -> dict:
+        data = json.loads(content)
+        ContentGenerator._validate_json_structure(data)
+        data.pop("fallback", None)  # флаг заглушки ставит только _fallback_json
+        return data
+
+    @staticmethod
+    def _parse_section_plan(content: str) -> List[dict]:
+        sections = json.loads(content).get("sections", [])
+        sections = [
+            {"title": str(s["title"]).strip(), "focus": str(s.get("focus", "")).strip()}
+            for s in sections
+            if isinstance(s, dict) and str(s.get("title", "")).strip()
+        ]
+        if not sections:
+            raise ValueError("План разделов пуст")
+        return sections
+
+    @staticmethod
+    def _parse_section(content: str) -> str:
+        data = json.loads(content)
+        if not isinstance(data.get("content"), str) or not data["content"].strip():
+            raise ValueError("В JSON раздела отсутствует поле: content")
+        return data["content"]
+
+    @staticmethod
+    @Tracer.traced("validate.json")
     def _validate_json_structure(data: dict):
         required = ["chapter_title", "content"]  # key_points больше не обязательно
         for key in required:
@@ -152,18 +441,15 @@ class ContentGenerator:
     # VALIDATION — исправленная версия
     # ================================================================
     @staticmethod
+    @Tracer.traced("validate.content")
     def _is_content_valid(text: str) -> bool:
         """
         Проверка форматирования без таблиц вне блоков кода и LaTeX.
         Возвращает True если валидно, иначе False.
         """
         try:
-            # Убираем все LaTeX блоки
-            cleaned = re.sub(r"\$\$.*?\$\$", "", text, flags=re.DOTALL)
-            cleaned = re.sub(r"\$.*?\$", "", cleaned, flags=re.DOTALL)
-
-            # Убираем все код-блоки ```...```
-            cleaned = re.sub(r"```.*?```", "", cleaned, flags=re.DOTALL)
+            # Убираем все LaTeX блоки и код-блоки ```...```
+            cleaned = ContentGenerator._outside_math_and_code(text)
 
             # Проверка на символы | (таблицы)
             if "|" in cleaned:
@@ -209,10 +495,7 @@ class ContentGenerator:
         issues = []
 
         # Проверка на |
-        cleaned = re.sub(r"\$\$.*?\$\$", "", text, flags=re.DOTALL)
-        cleaned = re.sub(r"\$.*?\$", "", cleaned, flags=re.DOTALL)
-        cleaned = re.sub(r"```.*?```", "", cleaned, flags=re.DOTALL)
-        if "|" in cleaned:
+        if "|" in ContentGenerator._outside_math_and_code(text):
             issues.append("Найдены символы | вне блоков → таблица не допускается")
 
         # Проверка длины LaTeX блоков
@@ -221,6 +504,10 @@ class ContentGenerator:
             if len(block.strip()) == 0:
                 issues.append("Пустой LaTeX блок")
 
+        for defect in ContentGenerator._find_defects(text):
+            where = f"Строка {defect.end}" if defect.end - defect.start == 1 else f"Строки {defect.start + 1}–{defect.end}"
+            issues.append(f"{where}: {defect.problem}")
+
         return "\n".join(issues) if issues else "Не выявлено явных проблем"
 
     # ================================================================
@@ -231,6 +518,7 @@ class ContentGenerator:
         return {
             "chapter_title": chapter.title,
             "content": f"# {chapter.title}\n\n{chapter.description}\n\nМатериал временно недоступен.",
+            "fallback": True,
             "key_points": [
                 "Основные понятия",
                 "Важные элементы",
@@ -262,6 +550,61 @@ class ContentGenerator:
     - Include lists, headers, and formatting as appropriate.
     - The content Must Be written in Russian
 
+    RESPONSE:
+    - Only JSON. No extra text or explanations outside JSON.
+        """
+
+    @staticmethod
+    def _create_plan_prompt(chapter: Chapter) -> str:
+        return f"""
+    Create a short plan of sections for an educational chapter.
+
+    Chapter: "{chapter.title}"
+    Chapter description: "{chapter.description}"
+
+    JSON FORMAT:
+    {{
+      "sections": [
+        {{"title": "Section title in Russian", "focus": "One sentence: what this section covers"}}
+      ]
+    }}
+
+    REQUIREMENTS:
+    - 3 to {Config.SECTION_MAX_COUNT} sections, from basics to more advanced material.
+    - Sections must not overlap.
+    - Titles and focus must be written in RUSSIAN.
+
+    RESPONSE:
+    - Only JSON. No extra text or explanations outside JSON.
+        """
+
+    @staticmethod
+    def _create_section_prompt(chapter: Chapter, section: dict, titles: List[str]) -> str:
+        plan = "\n".join(f"    - {title}" for title in titles)
+        return f"""
+    Generate ONE SECTION of an educational chapter in STRICTLY VALID JSON format.
+
+    IMPORTANT: The response MUST be a VALID JSON object.
+
+    Chapter: "{chapter.title}"
+    Chapter plan (other sections are written separately, do NOT cover them):
+{plan}
+
+    THIS SECTION: "{section['title']}"
+    Focus: {section['focus']}
+
+    JSON FORMAT:
+    {{
+      "section_title": "{section['title']}",
+      "content": "Markdown text of this section only (WITHOUT the section title, WITHOUT tables)"
+    }}
+
+    CONTENT REQUIREMENTS:
+    - Only use Markdown. Use only ### and deeper headers inside the section.
+    - Absolutely NO tables.
+    - Formulas should use LaTeX syntax: $...$ for inline, $$...$$ for block.
+    - The content must be detailed, well-structured, and written in RUSSIAN.
+
     RESPONSE:
     - Only JSON. No extra text or explanations outside JSON.
         """
@@ -270,6 +613,7 @@ class ContentGenerator:
     # LOGGING
     # ================================================================
     @staticmethod
+    @Tracer.traced("disk.save_raw")
     def _save_raw(prefix: str, content: str, chapter: str, attempt: int):
         try:
             base = "content_logs"
@@ -1,5 +1,6 @@
-import openai
+from app.circuit_breaker import CircuitOpenError
 from app.config import Config
+from app.llm import LLM
 from app.models import CourseSkeleton, Chapter
 import json
 import logging
@@ -8,12 +9,6 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-client = openai.OpenAI(
-    base_url=Config.OPENROUTER_BASE_URL,
-    api_key=Config.OPENROUTER_API_KEY
-)
-
-
 class CourseGenerator:
     @staticmethod
     def generate_skeleton(topic: str) -> CourseSkeleton:
@@ -41,40 +36,18 @@ class CourseGenerator:
             logger.info(f"📨 Отправляем запрос к API OpenRouter с моделью: {Config.MODEL_NAME}")
             logger.debug(f"Промпт: {prompt}")
 
-            response = client.chat.completions.create(
-                model=Config.MODEL_NAME,
+            content = LLM.complete(
                 messages=[{"role": "user", "content": prompt}],
+                agent="skeleton",
+                validate=CourseGenerator._parse_skeleton,
                 temperature=0.7
             )
 
             logger.info("✅ Получен ответ от API")
-            content = response.choices[0].message.content
             logger.debug(f"Сырой ответ от API: {content}")
 
-            # Извлекаем JSON из ответа
-            json_start = content.find('{')
-            json_end = content.rfind('}') + 1
-
-            if json_start == -1 or json_end == 0:
-                logger.warning("❌ Не удалось найти JSON в ответе, используем fallback")
-                raise ValueError("JSON not found in response")
-
-            json_str = content[json_start:json_end]
-            logger.debug(f"Извлеченный JSON: {json_str}")
-
-            data = json.loads(json_str)
-            logger.info(f"📚 Успешно распарсен JSON, глав: {len(data['chapters'])}")
-
-            chapters = [
-                Chapter(title=chap["title"], description=chap["description"])
-                for chap in data["chapters"]
-            ]
-
-            result = CourseSkeleton(
-                title=data["title"],
-                description=data["description"],
-                chapters=chapters
-            )
+            result = CourseGenerator._parse_skeleton(content)
+            logger.info(f"📚 Успешно распарсен JSON, глав: {len(result.chapters)}")
 
             logger.info(f"✅ Структура курса создана: {result.title}")
             logger.debug(f"Детали курса: {result}")
@@ -83,7 +56,8 @@ class CourseGenerator:
 
         except Exception as e:
             logger.error(f"❌ Ошибка при генерации структуры курса: {str(e)}")
-            logger.exception(e)
+            if not isinstance(e, CircuitOpenError):
+                logger.exception(e)
 
             # Fallback структура
             fallback = CourseSkeleton(
@@ -95,8 +69,29 @@ class CourseGenerator:
                     Chapter(title="Практическое применение", description="Реальные примеры"),
                     Chapter(title="Продвинутые темы", description="Углубленное изучение"),
                     Chapter(title="Заключение", description="Итоги и дальнейшие шаги")
-                ]
+                ],
+                fallback=True
             )
 
             logger.info("🔄 Используем fallback структуру курса")
-            return fallback
\ No newline at end of file
+            return fallback
+
+    @staticmethod
+    def _parse_skeleton(content: str) -> CourseSkeleton:
+        # Извлекаем JSON из ответа
+        json_start = content.find('{')
+        json_end = content.rfind('}') + 1
+
+        if json_start == -1 or json_end == 0:
+            raise ValueError("JSON not found in response")
+
+        data = json.loads(content[json_start:json_end])
+        chapters = [
+            Chapter(title=chap["title"], description=chap["description"])
+            for chap in data["chapters"]
+        ]
+        return CourseSkeleton(
+            title=data["title"],
+            description=data["description"],
+            chapters=chapters
+        )
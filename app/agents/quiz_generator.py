@@ -1,28 +1,31 @@
-import openai
-from app.config import Config
+from app.circuit_breaker import CircuitOpenError
+from app.llm import LLM
 from app.models import Question, Quiz, LessonContent
+from app.tracing import Tracer
+from app.usage import Usage
 import json
 import logging
 import time
 
 logger = logging.getLogger(__name__)
 
-client = openai.OpenAI(
-    base_url=Config.OPENROUTER_BASE_URL,
-    api_key=Config.OPENROUTER_API_KEY
-)
-
-
 class QuizGenerator:
     MAX_RETRIES = 3
     RETRY_DELAY = 1  # секунды между попытками
+    QUESTION_COUNT = 3
+    REDUCED_QUESTION_COUNT = 1  # когда бюджет курса на исходе
 
     @staticmethod
     def generate_quiz(lesson_content: LessonContent) -> Quiz:
         logger.info(f"🎯 Генерируем тест для главы: {lesson_content.chapter_title}")
 
+        question_count = QuizGenerator.QUESTION_COUNT
+        if Usage.budget_low():
+            question_count = QuizGenerator.REDUCED_QUESTION_COUNT
+            logger.warning(f"💰 Бюджет курса на исходе → тест из {question_count} вопросов")
+
         prompt_template = (
-            "На основе учебного материала создай тест из 3 вопросов для студентов.\n"
+            f"На основе учебного материала создай тест из {question_count} вопросов для студентов.\n"
             "Вопросы должны проверять понимание материала, включая формулы, определения и ключевые моменты.\n"
             "Используй LaTeX для всех формул (например, $\\lim_{x \\to a} f(x) = L$ или $\\varepsilon$).\n\n"
             f"Глава: {lesson_content.chapter_title}\n"
@@ -44,37 +47,26 @@ class QuizGenerator:
 
         for attempt in range(QuizGenerator.MAX_RETRIES):
             try:
-                response = client.chat.completions.create(
-                    model=Config.MODEL_NAME,
+                content = LLM.complete(
                     messages=[{"role": "user", "content": prompt_template}],
+                    agent="quiz",
+                    attempt=attempt,
+                    validate=QuizGenerator._parse_quiz,
                     temperature=0.7
                 )
 
-                content = response.choices[0].message.content
-                json_start = content.find('{')
-                json_end = content.rfind('}') + 1
-                if json_start == -1 or json_end == 0:
-                    raise ValueError("JSON not found in quiz response")
-
-                data = json.loads(content[json_start:json_end])
-
-                questions = []
-                for q in data.get('questions', []):
-                    if all(k in q for k in ['question', 'options', 'correct_answer', 'explanation']):
-                        questions.append(Question(
-                            question=q["question"],
-                            options=q["options"],
-                            correct_answer=q["correct_answer"],
-                            explanation=q["explanation"]
-                        ))
-
-                if not questions:
-                    raise ValueError("No valid questions created")
+                with Tracer.span("validate.quiz", attempt=attempt + 1):
+                    return QuizGenerator._parse_quiz(content)
 
-                return Quiz(chapter_title=data["chapter_title"], questions=questions)
+            except CircuitOpenError:
+                logger.warning("🔴 Провайдер недоступен → fallback-тест без повторных попыток")
+                break
 
             except Exception as e:
                 logger.error(f"❌ Ошибка генерации JSON (попытка {attempt + 1}): {str(e)}")
+                if Usage.budget_exhausted():
+                    logger.warning("💰 Бюджет курса исчерпан → fallback-тест без повторных попыток")
+                    break
                 if attempt < QuizGenerator.MAX_RETRIES - 1:
                     logger.info(f"🔄 Повторная попытка через {QuizGenerator.RETRY_DELAY} сек...")
                     time.sleep(QuizGenerator.RETRY_DELAY)
@@ -89,6 +81,31 @@ class QuizGenerator:
                 options=["Тема A", "Тема B", "Тема C", "Тема D"],
                 correct_answer="Тема A",
                 explanation="Эта тема является основной для данной главы"
-            )]
+            )],
+            fallback=True
         )
         return fallback
+
+    @staticmethod
+    def _parse_quiz(content: str) -> Quiz:
+        json_start = content.find('{')
+        json_end = content.rfind('}') + 1
+        if json_start == -1 or json_end == 0:
+            raise ValueError("JSON not found in quiz response")
+
+        data = json.loads(content[json_start:json_end])
+
+        questions = []
+        for q in data.get('questions', []):
+            if all(k in q for k in ['question', 'options', 'correct_answer', 'explanation']):
+                questions.append(Question(
+                    question=q["question"],
+                    options=q["options"],
+                    correct_answer=q["correct_answer"],
+                    explanation=q["explanation"]
+                ))
+
+        if not questions:
+            raise ValueError("No valid questions created")
+
+        return Quiz(chapter_title=data["chapter_title"], questions=questions)
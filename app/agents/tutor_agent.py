@@ -1,16 +1,11 @@
-import openai
-from app.config import Config
+from app.circuit_breaker import CircuitOpenError
+from app.llm import LLM
 from app.models import TutorResponse
+from app.tutor_cache import TutorCache
 import logging
 
 logger = logging.getLogger(__name__)
 
-client = openai.OpenAI(
-    base_url=Config.OPENROUTER_BASE_URL,
-    api_key=Config.OPENROUTER_API_KEY
-)
-
-
 class TutorAgent:
     @staticmethod
     def answer_question(question: str, course_content: dict) -> TutorResponse:
@@ -33,6 +28,13 @@ class TutorAgent:
         logger.debug(f"Длина контекста: {len(context)} символов")
         logger.debug(f"Количество глав в контексте: {len(course_content.get('content', []))}")
 
+        # Тот же курс и тот же (или очень похожий) вопрос — ответ из кэша без обращения к LLM
+        course_key = TutorCache.course_key(context)
+        cached = TutorCache.get(course_key, question)
+        if cached is not None:
+            logger.info("♻ Ответ репетитора взят из кэша")
+            return TutorResponse(answer=cached, sources=[])
+
         prompt = f"""
         You are an experienced tutor. Your goal is to explain the topic to the student in a clear, structured and helpful way, based strictly on the course materials.
 
@@ -75,15 +77,15 @@ Now provide a full, helpful answer in Russian.
             logger.info("📨 Отправляем вопрос репетитору в API")
             logger.debug(f"Длина промпта: {len(prompt)} символов")
 
-            response = client.chat.completions.create(
-                model=Config.MODEL_NAME,
+            answer = LLM.complete(
                 messages=[{"role": "user", "content": prompt}],
+                agent="tutor",
                 temperature=0.3,
                 max_tokens=750
             )
 
             logger.info("✅ Получен ответ от репетитора")
-            answer = response.choices[0].message.content
+            TutorCache.put(course_key, question, answer)
             logger.debug(f"Ответ репетитора (первые 200 символов): {answer[:200]}...")
 
             # Извлекаем источники из ответа
@@ -101,7 +103,8 @@ Now provide a full, helpful answer in Russian.
 
         except Exception as e:
             logger.error(f"❌ Ошибка при получении ответа от репетитора: {str(e)}")
-            logger.exception(e)
+            if not isinstance(e, CircuitOpenError):
+                logger.exception(e)
 
             fallback = TutorResponse(
                 answer="Извините, не могу ответить на вопрос в данный момент. Пожалуйста, попробуйте позже или переформулируйте вопрос.",
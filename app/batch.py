@@ -0,0 +1,199 @@
+"""
+Пакетная генерация каталога курсов.
+
+Запуск из командной строки:
+    python -m app.batch topics.txt --output catalog.jsonl.gz
+
+topics.txt — по одной теме на строку. Прогресс сохраняется в
+<output>.checkpoint.json; повторный запуск с тем же --output продолжит
+с места остановки.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+import uuid
+from typing import List, Optional
+
+from app.config import Config
+from app.course_store import CourseStore
+from app.library import CourseLibrary
+from app.models import BatchStatus
+from app.pipeline import CoursePipeline
+from app.usage import Usage
+from app.responses import dump_json
+
+logger = logging.getLogger(__name__)
+
+
+class BatchRunner:
+    """
+    Генерирует курсы по списку тем.
+    → до BATCH_MAX_TOPICS тем одновременно, внутри каждой — все главы параллельно
+    → общий лимит запросов к провайдеру задаёт app.llm.LLM
+    → каждый готовый курс дописывается отдельным gzip-фрагментом в JSONL.gz
+    → после каждого курса обновляется checkpoint
+    → курс с заглушками агентов считается неудачей и при возобновлении генерируется заново
+    """
+
+    def __init__(self, topics: List[str], output_path: str, max_topics: Optional[int] = None):
+        # Дубликаты тем не генерируем дважды, порядок сохраняем
+        self.topics = list(dict.fromkeys(t.strip() for t in topics if t.strip()))
+        self.output_path = output_path
+        self.checkpoint_path = BatchRunner.checkpoint_path_for(output_path)
+        self.max_topics = max_topics or Config.BATCH_MAX_TOPICS
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def checkpoint_path_for(output_path: str) -> str:
+        return f"{output_path}.checkpoint.json"
+
+    # ================================================================
+    # CHECKPOINT
+    # ================================================================
+    @staticmethod
+    def load_checkpoint(checkpoint_path: str) -> dict:
+        if not os.path.exists(checkpoint_path):
+            return {"total": 0, "completed": [], "failed": [], "finished": False}
+        with open(checkpoint_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_checkpoint(self, state: dict):
+        # Атомарная запись: сначала во временный файл, затем rename
+        tmp = f"{self.checkpoint_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp, self.checkpoint_path)
+
+    # ================================================================
+    # RUN
+    # ================================================================
+    async def run(self) -> dict:
+        directory = os.path.dirname(self.output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        state = BatchRunner.load_checkpoint(self.checkpoint_path)
+        state["total"] = len(self.topics)
+        state["finished"] = False
+        done = set(state["completed"])
+        # Упавшие в прошлый раз темы пробуем снова
+        state["failed"] = []
+        pending = [t for t in self.topics if t not in done]
+
+        logger.info(f"📦 Пакетная генерация: {len(pending)} тем к генерации, {len(done)} уже готово")
+        self._save_checkpoint(state)
+
+        start_time = time.time()
+        semaphore = asyncio.Semaphore(self.max_topics)
+
+        async def worker(topic: str):
+            async with semaphore:
+                try:
+                    with Usage.scope("batch", Config.COURSE_TOKEN_BUDGET, Config.COURSE_TIME_BUDGET) as usage:
+                        course = await CoursePipeline.generate(topic)
+                        # Агенты не пробрасывают ошибки провайдера и не поддающиеся разбору ответы, а отдают заглушки:
+                        # такой курс в каталог не пишем, тема попадёт в failed и повторится при следующем запуске
+                        if CourseLibrary.has_fallback(course):
+                            raise RuntimeError("часть курса — заглушка агента")
+                        CourseStore.save(course)
+                        usage.scope_id = course.course_id
+                    if Config.LIBRARY_ENABLED:
+                        CourseLibrary.add(course)
+                    line = dump_json(course) + b"\n"
+                except Exception as e:
+                    logger.error(f"❌ Тема '{topic}' не сгенерирована: {e}")
+                    async with self._lock:
+                        state["failed"].append(topic)
+                        self._save_checkpoint(state)
+                    return
+
+                async with self._lock:
+                    # Каждый курс — отдельный gzip-member: при падении теряется только хвост
+                    with gzip.open(self.output_path, "ab") as f:
+                        f.write(line)
+                    state["completed"].append(topic)
+                    self._save_checkpoint(state)
+                    logger.info(f"✅ [{len(state['completed'])}/{state['total']}] {topic}")
+
+        await asyncio.gather(*[worker(t) for t in pending])
+
+        state["finished"] = True
+        self._save_checkpoint(state)
+        logger.info(
+            f"📦 Пакет завершён за {time.time() - start_time:.2f} сек: "
+            f"{len(state['completed'])} готово, {len(state['failed'])} с ошибками"
+        )
+        return state
+
+
+class BatchManager:
+    """
+    Пакеты, запущенные через API. Статус читается из checkpoint-файла,
+    поэтому доступен из любого воркера.
+    """
+
+    # Ссылки на фоновые задачи, чтобы их не собрал GC
+    _tasks = set()
+
+    @staticmethod
+    def output_path(batch_id: str) -> str:
+        return os.path.join(Config.BATCH_DIR, f"{batch_id}.jsonl.gz")
+
+    @staticmethod
+    def start(topics: List[str]) -> str:
+        batch_id = uuid.uuid4().hex
+        runner = BatchRunner(topics, BatchManager.output_path(batch_id))
+        # Checkpoint создаём сразу, чтобы статус был доступен до первого курса
+        os.makedirs(Config.BATCH_DIR, exist_ok=True)
+        runner._save_checkpoint({"total": len(runner.topics), "completed": [], "failed": [], "finished": False})
+        task = asyncio.get_running_loop().create_task(runner.run())
+        BatchManager._tasks.add(task)
+        task.add_done_callback(BatchManager._tasks.discard)
+        logger.info(f"📦 Запущен пакет {batch_id}: {len(runner.topics)} тем")
+        return batch_id
+
+    @staticmethod
+    def status(batch_id: str) -> Optional[BatchStatus]:
+        output = BatchManager.output_path(batch_id)
+        checkpoint = BatchRunner.checkpoint_path_for(output)
+        if not os.path.exists(checkpoint):
+            return None
+
+        state = BatchRunner.load_checkpoint(checkpoint)
+        return BatchStatus(
+            batch_id=batch_id,
+            total=state["total"],
+            completed=len(state["completed"]),
+            failed=state["failed"],
+            finished=state["finished"],
+            output=output,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетная генерация каталога курсов")
+    parser.add_argument("topics_file", help="Файл со списком тем, по одной на строку")
+    parser.add_argument("--output", required=True, help="Путь к результату (.jsonl.gz)")
+    parser.add_argument("--max-topics", type=int, default=None, help="Сколько тем генерировать одновременно")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    with open(args.topics_file, "r", encoding="utf-8") as f:
+        topics = f.read().splitlines()
+
+    runner = BatchRunner(topics, args.output, args.max_topics)
+    state = asyncio.run(runner.run())
+    if state["failed"]:
+        logger.warning(f"⚠ Темы с ошибками: {', '.join(state['failed'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Провайдер признан неисправным — запрос не отправлялся."""
+
+
+class CircuitBreaker:
+    """
+    Автомат защиты для обращений к провайдеру.
+    → closed: запросы идут, результаты копятся в скользящем окне
+    → open: доля ошибок или медленных ответов превысила порог — запросы сразу отклоняются
+    → half_open: после паузы пропускаем пробные запросы; успех → closed, ошибка → снова open
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._state = CircuitBreaker.CLOSED
+        self._calls = deque()  # (timestamp, ok, latency)
+        self._opened_at = 0.0
+        self._probes = 0
+        self._last_error = None
+
+    # ================================================================
+    # PUBLIC
+    # ================================================================
+    def allow(self) -> bool:
+        """
+        Можно ли отправить запрос. В half_open пропускает не больше
+        BREAKER_HALF_OPEN_PROBES пробных запросов одновременно.
+        """
+        with self._lock:
+            if self._state == CircuitBreaker.OPEN:
+                if time.time() - self._opened_at < Config.BREAKER_OPEN_SECONDS:
+                    return False
+                self._state = CircuitBreaker.HALF_OPEN
+                self._probes = 0
+                logger.info(f"🟡 [{self.name}] Автомат в half-open: пробуем провайдер")
+
+            if self._state == CircuitBreaker.HALF_OPEN:
+                if self._probes >= Config.BREAKER_HALF_OPEN_PROBES:
+                    return False
+                self._probes += 1
+
+            return True
+
+    def release(self):
+        """
+        Возвращает пропуск allow(), если запрос так и не ушёл к провайдеру
+        (ни record_success, ни record_failure не будет) — иначе half_open застрянет без проб.
+        """
+        with self._lock:
+            if self._state == CircuitBreaker.HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+
+    def record_success(self, latency: float):
+        slow = latency >= Config.BREAKER_SLOW_CALL_SECONDS
+        with self._lock:
+            if self._state == CircuitBreaker.HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                if slow:
+                    self._trip(f"медленный пробный ответ ({latency:.1f} сек)")
+                else:
+                    self._state = CircuitBreaker.CLOSED
+                    self._calls.clear()
+                    logger.info(f"🟢 [{self.name}] Провайдер восстановился, автомат замкнут")
+                return
+
+            self._calls.append((time.time(), True, latency))
+            self._evaluate()
+
+    def record_failure(self, error: Exception, latency: float):
+        with self._lock:
+            self._last_error = f"{type(error).__name__}: {error}"[:200]
+            if self._state == CircuitBreaker.HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                self._trip("ошибка пробного запроса")
+                return
+
+            self._calls.append((time.time(), False, latency))
+            self._evaluate()
+
+    def is_open(self) -> bool:
+        with self._lock:
+            return (
+                self._state == CircuitBreaker.OPEN
+                and time.time() - self._opened_at < Config.BREAKER_OPEN_SECONDS
+            )
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._prune()
+            total = len(self._calls)
+            errors = sum(1 for _, ok, _ in self._calls if not ok)
+            slow = sum(1 for _, _, latency in self._calls if latency >= Config.BREAKER_SLOW_CALL_SECONDS)
+            return {
+                "state": self._state,
+                "window_calls": total,
+                "error_rate": round(errors / total, 3) if total else 0.0,
+                "slow_rate": round(slow / total, 3) if total else 0.0,
+                "opened_at": self._opened_at or None,
+                "last_error": self._last_error,
+            }
+
+    # ================================================================
+    # INTERNAL (вызывать под self._lock)
+    # ================================================================
+    def _prune(self):
+        border = time.time() - Config.BREAKER_WINDOW_SECONDS
+        while self._calls and self._calls[0][0] < border:
+            self._calls.popleft()
+
+    def _evaluate(self):
+        self._prune()
+        total = len(self._calls)
+        if self._state != CircuitBreaker.CLOSED or total < Config.BREAKER_MIN_CALLS:
+            return
+
+        errors = sum(1 for _, ok, _ in self._calls if not ok)
+        slow = sum(1 for _, _, latency in self._calls if latency >= Config.BREAKER_SLOW_CALL_SECONDS)
+
+        if errors / total >= Config.BREAKER_ERROR_RATE:
+            self._trip(f"доля ошибок {errors}/{total}")
+        elif slow / total >= Config.BREAKER_SLOW_RATE:
+            self._trip(f"доля медленных ответов {slow}/{total}")
+
+    def _trip(self, reason: str):
+        self._state = CircuitBreaker.OPEN
+        self._opened_at = time.time()
+        self._calls.clear()
+        logger.warning(
+            f"🔴 [{self.name}] Автомат разомкнут: {reason}. "
+            f"Запросы отклоняются {Config.BREAKER_OPEN_SECONDS} сек"
+        )
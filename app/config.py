@@ -6,4 +6,105 @@ load_dotenv()
 class Config:
     OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
     OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL")
-    MODEL_NAME = os.getenv("MODEL_NAME", "x-ai/grok-4.1-fast:free")
\ No newline at end of file
+    MODEL_NAME = os.getenv("MODEL_NAME", "x-ai/grok-4.1-fast:free")
+
+    # Сериализация и сжатие ответов
+    COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+    GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+    BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+    # Хранилище готовых курсов
+    COURSE_STORE_SIZE = int(os.getenv("COURSE_STORE_SIZE", "200"))
+    COURSE_CACHE_CONTROL = os.getenv("COURSE_CACHE_CONTROL", "private, max-age=86400")
+
+    # Общее состояние воркеров (SQLite WAL)
+    SHARED_DB_PATH = os.getenv("SHARED_DB_PATH", "data/course_generator.db")
+    SHARED_DB_TIMEOUT = float(os.getenv("SHARED_DB_TIMEOUT", "30"))
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+    LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+
+    # Очистка общего хранилища (записи старше срока удаляются раз в SHARED_DB_PURGE_INTERVAL)
+    SHARED_DB_PURGE_INTERVAL = float(os.getenv("SHARED_DB_PURGE_INTERVAL", "3600"))
+    LLM_CACHE_MAX_AGE = int(os.getenv("LLM_CACHE_MAX_AGE", str(30 * 24 * 3600)))
+    RENDER_CACHE_MAX_AGE = int(os.getenv("RENDER_CACHE_MAX_AGE", str(30 * 24 * 3600)))
+    USAGE_LOG_MAX_AGE = int(os.getenv("USAGE_LOG_MAX_AGE", str(90 * 24 * 3600)))
+
+    # Реестр генераций «в процессе»
+    JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "1800"))
+    JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "300"))
+    JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+
+    # Сервер
+    HOST = os.getenv("HOST", "0.0.0.0")
+    PORT = int(os.getenv("PORT", "8000"))
+    WORKERS = int(os.getenv("WORKERS", "1"))
+
+    # Общий бюджет обращений к провайдеру (на весь сервис: параллельность делится между воркерами)
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    LLM_RATE_LIMIT_RPM = int(os.getenv("LLM_RATE_LIMIT_RPM", "0"))
+    PIPELINE_THREADS = int(os.getenv("PIPELINE_THREADS", "32"))
+
+    # Пакетная генерация каталога
+    BATCH_DIR = os.getenv("BATCH_DIR", "data/batches")
+    BATCH_MAX_TOPICS = int(os.getenv("BATCH_MAX_TOPICS", "8"))
+
+    # Ленивая загрузка глав
+    OUTLINE_EXCERPT_LENGTH = int(os.getenv("OUTLINE_EXCERPT_LENGTH", "200"))
+    COURSE_PARSE_CACHE_SIZE = int(os.getenv("COURSE_PARSE_CACHE_SIZE", "32"))
+
+    # Серверный пререндер уроков в HTML (нужны markdown-it-py, mdit-py-plugins, latex2mathml)
+    PRERENDER_HTML = os.getenv("PRERENDER_HTML", "0") == "1"
+
+    # Точечный ремонт форматирования
+    SEGMENT_REPAIR = os.getenv("SEGMENT_REPAIR", "1") == "1"
+    REPAIR_CONTEXT_LINES = int(os.getenv("REPAIR_CONTEXT_LINES", "2"))
+    REPAIR_MAX_SEGMENT_LINES = int(os.getenv("REPAIR_MAX_SEGMENT_LINES", "30"))
+
+    # Генерация глав по разделам
+    SECTIONED_LESSONS = os.getenv("SECTIONED_LESSONS", "0") == "1"
+    SECTION_MAX_COUNT = int(os.getenv("SECTION_MAX_COUNT", "6"))
+    SECTION_MAX_PARALLEL = int(os.getenv("SECTION_MAX_PARALLEL", "6"))
+    SECTION_MAX_TOKENS = int(os.getenv("SECTION_MAX_TOKENS", "1200"))
+
+    # Автомат защиты провайдера (circuit breaker)
+    LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+    BREAKER_WINDOW_SECONDS = int(os.getenv("BREAKER_WINDOW_SECONDS", "60"))
+    BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+    BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+    BREAKER_SLOW_CALL_SECONDS = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", "90"))
+    BREAKER_SLOW_RATE = float(os.getenv("BREAKER_SLOW_RATE", "0.8"))
+    BREAKER_OPEN_SECONDS = int(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+    BREAKER_HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "1"))
+
+    # Библиотека готовых курсов
+    LIBRARY_ENABLED = os.getenv("LIBRARY_ENABLED", "1") == "1"
+
+    # Учёт токенов и бюджеты курса (0 — без ограничения)
+    USAGE_HEADERS = os.getenv("USAGE_HEADERS", "1") == "1"
+    COURSE_TOKEN_BUDGET = int(os.getenv("COURSE_TOKEN_BUDGET", "0"))
+    COURSE_TIME_BUDGET = float(os.getenv("COURSE_TIME_BUDGET", "0"))
+    BUDGET_LOW_RATIO = float(os.getenv("BUDGET_LOW_RATIO", "0.8"))
+
+    # Фоновый прогрев популярных тем
+    WARMER_ENABLED = os.getenv("WARMER_ENABLED", "0") == "1"
+    WARMER_INTERVAL = float(os.getenv("WARMER_INTERVAL", "60"))
+    WARMER_IDLE_SECONDS = float(os.getenv("WARMER_IDLE_SECONDS", "30"))
+    WARMER_POLL_INTERVAL = float(os.getenv("WARMER_POLL_INTERVAL", "1"))
+    WARMER_RATE_LIMIT_RPM = int(os.getenv("WARMER_RATE_LIMIT_RPM", "6"))
+    WARMER_TOP_TOPICS = int(os.getenv("WARMER_TOP_TOPICS", "20"))
+    WARMER_MIN_SCORE = float(os.getenv("WARMER_MIN_SCORE", "2"))
+    WARMER_HALF_LIFE = float(os.getenv("WARMER_HALF_LIFE", str(3 * 24 * 3600)))
+    WARMER_REFRESH_SECONDS = float(os.getenv("WARMER_REFRESH_SECONDS", str(7 * 24 * 3600)))
+
+    # Трассировка и профилирование
+    TRACE_ENABLED = os.getenv("TRACE_ENABLED", "0") == "1"
+    TRACE_DIR = os.getenv("TRACE_DIR", "data/traces")
+    TRACE_MAX_FILES = int(os.getenv("TRACE_MAX_FILES", "500"))
+    PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.01"))
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+    # Кэш ответов репетитора
+    TUTOR_CACHE_ENABLED = os.getenv("TUTOR_CACHE_ENABLED", "1") == "1"
+    TUTOR_CACHE_SIZE = int(os.getenv("TUTOR_CACHE_SIZE", "1000"))
+    TUTOR_CACHE_TTL = int(os.getenv("TUTOR_CACHE_TTL", str(24 * 3600)))
+    TUTOR_CACHE_SIMILARITY = float(os.getenv("TUTOR_CACHE_SIMILARITY", "0.85"))
@@ -0,0 +1,119 @@
+import logging
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from app.config import Config
+from app.models import FullCourse, CourseOutline, ChapterSummary
+from app.responses import dump_json, make_etag
+from app.shared_state import SharedState
+from app.tracing import Tracer
+
+logger = logging.getLogger(__name__)
+
+
+class CourseStore:
+    """
+    Хранилище готовых курсов (общее для всех воркеров).
+    Курс сериализуется ОДИН раз при сохранении — дальше отдаются готовые bytes и ETag.
+    """
+
+    # Разобранные курсы для выдачи по главам: (course_id, etag) → FullCourse
+    _parsed: "OrderedDict[Tuple[str, str], FullCourse]" = OrderedDict()
+    _parsed_lock = threading.Lock()
+
+    @staticmethod
+    def normalize_topic(topic: str) -> str:
+        return re.sub(r"\s+", " ", topic).strip().lower()
+
+    @staticmethod
+    @Tracer.traced("store.save")
+    def save(course: FullCourse) -> Tuple[str, bytes, str]:
+        if not course.course_id:
+            course.course_id = uuid.uuid4().hex
+
+        body = dump_json(course)
+        etag = make_etag(body)
+
+        conn = SharedState.connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO courses (course_id, topic_key, body, etag, created_at) VALUES (?, ?, ?, ?, ?)",
+            (course.course_id, CourseStore.normalize_topic(course.topic), body, etag, time.time())
+        )
+        # Оставляем только COURSE_STORE_SIZE самых свежих курсов (курсы из библиотеки не трогаем)
+        conn.execute(
+            "DELETE FROM courses WHERE course_id NOT IN "
+            "(SELECT course_id FROM courses ORDER BY created_at DESC LIMIT ?) "
+            "AND course_id NOT IN (SELECT course_id FROM library)",
+            (Config.COURSE_STORE_SIZE,)
+        )
+
+        logger.info(f"💾 Курс сохранён: {course.course_id} ({len(body)} байт)")
+        return course.course_id, body, etag
+
+    @staticmethod
+    def get(course_id: str) -> Optional[Tuple[bytes, str]]:
+        row = SharedState.connection().execute(
+            "SELECT body, etag FROM courses WHERE course_id = ?",
+            (course_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return bytes(row[0]), row[1]
+
+    @staticmethod
+    def load(course_id: str) -> Optional[FullCourse]:
+        """
+        Курс как модель — для выдачи структуры, уроков и тестов по отдельности.
+        Разбор JSON кэшируется, чтобы соседние запросы глав не парсили курс заново.
+        """
+        entry = CourseStore.get(course_id)
+        if entry is None:
+            return None
+
+        body, etag = entry
+        key = (course_id, etag)
+        with CourseStore._parsed_lock:
+            course = CourseStore._parsed.get(key)
+            if course is not None:
+                CourseStore._parsed.move_to_end(key)
+                return course
+
+        course = FullCourse.model_validate_json(body)
+
+        with CourseStore._parsed_lock:
+            CourseStore._parsed[key] = course
+            while len(CourseStore._parsed) > Config.COURSE_PARSE_CACHE_SIZE:
+                CourseStore._parsed.popitem(last=False)
+        return course
+
+    @staticmethod
+    def outline(course: FullCourse) -> CourseOutline:
+        """
+        Структура курса и краткие сводки глав — без полного текста уроков.
+        """
+        chapters = []
+        for i, lesson in enumerate(course.content):
+            description = course.skeleton.chapters[i].description if i < len(course.skeleton.chapters) else ""
+            excerpt = lesson.content[:Config.OUTLINE_EXCERPT_LENGTH]
+            if len(lesson.content) > Config.OUTLINE_EXCERPT_LENGTH:
+                excerpt += "..."
+            chapters.append(ChapterSummary(
+                index=i,
+                chapter_title=lesson.chapter_title,
+                description=description,
+                excerpt=excerpt,
+                key_points=lesson.key_points,
+                content_length=len(lesson.content),
+                question_count=len(course.quizzes[i].questions) if i < len(course.quizzes) else 0,
+            ))
+
+        return CourseOutline(
+            course_id=course.course_id,
+            topic=course.topic,
+            skeleton=course.skeleton,
+            chapters=chapters,
+        )
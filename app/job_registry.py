@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Optional
+
+from app.config import Config
+from app.shared_state import SharedState
+
+logger = logging.getLogger(__name__)
+
+
+class JobRegistry:
+    """
+    Реестр генераций «в процессе», общий для всех воркеров.
+    Если курс по той же теме уже генерируется в другом процессе,
+    второй запрос не запускает дублирующую генерацию, а дожидается результата.
+    """
+
+    OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+    @staticmethod
+    def acquire(job_key: str) -> bool:
+        """
+        Пытается занять задачу. True — мы владелец и должны генерировать сами.
+        Зависшие задачи (старше JOB_STALE_SECONDS) перехватываются.
+        """
+        now = time.time()
+        conn = SharedState.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT status, started_at FROM jobs WHERE job_key = ?",
+                (job_key,)
+            ).fetchone()
+
+            if row is not None and row[0] == "running" and now - row[1] < Config.JOB_STALE_SECONDS:
+                conn.execute("COMMIT")
+                return False
+
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (job_key, owner, status, course_id, started_at, finished_at) "
+                "VALUES (?, ?, 'running', NULL, ?, NULL)",
+                (job_key, JobRegistry.OWNER, now)
+            )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def is_running(job_key: str) -> bool:
+        row = SharedState.connection().execute(
+            "SELECT status, started_at FROM jobs WHERE job_key = ?",
+            (job_key,)
+        ).fetchone()
+        return row is not None and row[0] == "running" and time.time() - row[1] < Config.JOB_STALE_SECONDS
+
+    @staticmethod
+    def touch(job_key: str):
+        """Продлевает свою задачу: долгая работа не должна считаться зависшей и перехватываться."""
+        SharedState.connection().execute(
+            "UPDATE jobs SET started_at = ? WHERE job_key = ? AND owner = ? AND status = 'running'",
+            (time.time(), job_key, JobRegistry.OWNER)
+        )
+
+    @staticmethod
+    def release(job_key: str, course_id: Optional[str] = None):
+        status = "done" if course_id else "failed"
+        conn = SharedState.connection()
+        conn.execute(
+            "UPDATE jobs SET status = ?, course_id = ?, finished_at = ? WHERE job_key = ? AND owner = ?",
+            (status, course_id, time.time(), job_key, JobRegistry.OWNER)
+        )
+        # Чистим старые завершённые записи
+        conn.execute(
+            "DELETE FROM jobs WHERE status != 'running' AND finished_at < ?",
+            (time.time() - Config.JOB_RESULT_TTL,)
+        )
+
+    @staticmethod
+    async def wait_for(job_key: str, timeout: float) -> Optional[str]:
+        """
+        Ждёт завершения чужой задачи. Возвращает course_id или None,
+        если задача упала, пропала или не успела за timeout.
+        """
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            row = SharedState.connection().execute(
+                "SELECT status, course_id FROM jobs WHERE job_key = ?",
+                (job_key,)
+            ).fetchone()
+
+            if row is None or row[0] == "failed":
+                return None
+            if row[0] == "done":
+                return row[1]
+
+            await asyncio.sleep(Config.JOB_POLL_INTERVAL)
+
+        logger.warning(f"⏱ Не дождались задачи {job_key} за {timeout:.0f} сек")
+        return None
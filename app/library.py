@@ -0,0 +1,188 @@
+import logging
+import re
+import time
+from typing import List, Optional, Tuple
+
+from app.config import Config
+from app.models import FullCourse, LibraryEntry
+from app.shared_state import SharedState
+
+logger = logging.getLogger(__name__)
+
+
+class CourseLibrary:
+    """
+    Постоянная библиотека готовых курсов с полнотекстовым поиском (SQLite FTS5).
+    → индекс по темам, названиям курсов, названиям глав и тексту уроков
+    → поиск уже готового курса по той же или очень похожей теме
+    Тела курсов лежат в таблице courses (CourseStore) и не вытесняются,
+    пока курс есть в библиотеке.
+    """
+
+    # Слова, которые не меняют смысл запроса темы
+    FILLER_WORDS = {"курс", "курсы", "по", "о", "об", "про", "для", "и", "в", "на", "тема", "введение"}
+
+    @staticmethod
+    def normalize_topic(topic: str) -> str:
+        text = topic.lower().replace("ё", "е")
+        text = re.sub(r"[^\w\s+#]", " ", text)
+        words = [w for w in text.split() if w not in CourseLibrary.FILLER_WORDS]
+        return " ".join(words)
+
+    # ================================================================
+    # WRITE
+    # ================================================================
+    @staticmethod
+    def add(course: FullCourse):
+        if not course.course_id:
+            raise ValueError("Курс без course_id нельзя добавить в библиотеку")
+
+        if CourseLibrary.has_fallback(course):
+            logger.warning(f"⚠ Курс '{course.topic}' содержит fallback-контент → в библиотеку не добавлен")
+            return
+
+        conn = SharedState.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO library (course_id, topic, topic_key, title, created_at) VALUES (?, ?, ?, ?, ?)",
+                (course.course_id, course.topic, CourseLibrary.normalize_topic(course.topic),
+                 course.skeleton.title, time.time())
+            )
+            conn.execute("DELETE FROM library_fts WHERE course_id = ?", (course.course_id,))
+            conn.execute(
+                "INSERT INTO library_fts (course_id, topic, title, chapter_titles, lesson_text) VALUES (?, ?, ?, ?, ?)",
+                (
+                    course.course_id,
+                    f"{course.topic}\n{CourseLibrary.normalize_topic(course.topic)}",
+                    f"{course.skeleton.title}\n{course.skeleton.description}",
+                    "\n".join(chapter.title for chapter in course.skeleton.chapters),
+                    "\n\n".join(lesson.content for lesson in course.content),
+                )
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        logger.info(f"📚 Курс '{course.topic}' добавлен в библиотеку: {course.course_id}")
+
+    @staticmethod
+    def has_fallback(course: FullCourse) -> bool:
+        """Хотя бы одна часть курса — заглушка агента (структура, урок, раздел урока или тест)."""
+        return (
+            course.skeleton.fallback
+            or any(lesson.fallback for lesson in course.content)
+            or any(quiz.fallback for quiz in course.quizzes)
+        )
+
+    @staticmethod
+    def remove(course_id: str):
+        """Убирает курс из библиотеки; его тело снова может быть вытеснено из CourseStore."""
+        conn = SharedState.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM library WHERE course_id = ?", (course_id,))
+            conn.execute("DELETE FROM library_fts WHERE course_id = ?", (course_id,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    # ================================================================
+    # READ
+    # ================================================================
+    @staticmethod
+    def latest(topic: str) -> Optional[Tuple[str, float]]:
+        """(course_id, created_at) самого свежего курса с той же нормализованной темой."""
+        row = SharedState.connection().execute(
+            "SELECT course_id, created_at FROM library WHERE topic_key = ? ORDER BY created_at DESC LIMIT 1",
+            (CourseLibrary.normalize_topic(topic),)
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    @staticmethod
+    def find_similar(topic: str) -> Optional[str]:
+        """
+        course_id готового курса по той же теме.
+        Сначала точное совпадение нормализованной темы, затем кандидаты
+        из FTS по словам темы: тема считается той же, только если после
+        отбрасывания окончаний совпадают все слова (числа, римские цифры и + / # — буквально).
+        «Органическая химия» ≠ «Неорганическая химия», «XIX век» ≠ «XX век», «C++» ≠ «C#» ≠ «C».
+        """
+        topic_key = CourseLibrary.normalize_topic(topic)
+        if not topic_key:
+            return None
+
+        conn = SharedState.connection()
+        row = conn.execute(
+            "SELECT course_id FROM library WHERE topic_key = ? ORDER BY created_at DESC LIMIT 1",
+            (topic_key,)
+        ).fetchone()
+        if row:
+            return row[0]
+
+        query = CourseLibrary._fts_query(topic_key, operator="OR")
+        if not query:
+            return None
+        candidates = conn.execute(
+            "SELECT l.course_id, l.topic_key FROM library_fts f JOIN library l ON l.course_id = f.course_id "
+            "WHERE library_fts MATCH ? ORDER BY l.created_at DESC LIMIT 20",
+            (f"topic : ({query})",)
+        ).fetchall()
+
+        stems = CourseLibrary._stems(topic_key)
+        for course_id, candidate_key in candidates:
+            if CourseLibrary._stems(candidate_key) == stems:
+                logger.info(f"📚 Курс по той же теме в библиотеке ('{candidate_key}'): {course_id}")
+                return course_id
+        return None
+
+    # Окончания, которые отбрасываются при сравнении тем (от длинных к коротким)
+    ENDINGS = (
+        "ями", "ами", "ого", "его", "ому", "ему", "ыми", "ими",
+        "ая", "яя", "ое", "ее", "ой", "ей", "ий", "ый", "ые", "ие", "ых", "их", "ую", "юю",
+        "ам", "ям", "ах", "ях", "ом", "ем", "ов", "ев",
+        "ы", "и", "а", "я", "о", "е", "у", "ю", "ь", "й",
+    )
+
+    @staticmethod
+    def stem(word: str) -> str:
+        for ending in CourseLibrary.ENDINGS:
+            if word.endswith(ending) and len(word) - len(ending) >= 3:
+                return word[:-len(ending)]
+        return word
+
+    @staticmethod
+    def _stems(topic_key: str) -> List[str]:
+        # Слова темы целиком, вместе с + и #, которые сохраняет normalize_topic: «c++» ≠ «c#» ≠ «c»
+        return sorted(CourseLibrary.stem(w) for w in topic_key.split())
+
+    @staticmethod
+    def search(query: str, limit: int = 10) -> List[LibraryEntry]:
+        fts_query = CourseLibrary._fts_query(CourseLibrary.normalize_topic(query) or query.lower())
+        if not fts_query:
+            return []
+
+        rows = SharedState.connection().execute(
+            "SELECT l.course_id, l.topic, l.title, l.created_at, "
+            "snippet(library_fts, 4, '', '', '…', 16) "
+            "FROM library_fts f JOIN library l ON l.course_id = f.course_id "
+            "WHERE library_fts MATCH ? "
+            # Совпадения в теме и названиях весят больше, чем в тексте уроков
+            "ORDER BY bm25(library_fts, 0.0, 10.0, 5.0, 3.0, 1.0) LIMIT ?",
+            (fts_query, limit)
+        ).fetchall()
+
+        return [
+            LibraryEntry(course_id=r[0], topic=r[1], title=r[2], created_at=r[3], snippet=r[4] or "")
+            for r in rows
+        ]
+
+    @staticmethod
+    def _fts_query(text: str, operator: str = "AND") -> str:
+        # Каждое слово — префиксный поиск в кавычках, чтобы спецсимволы FTS5 не ломали запрос.
+        # Окончания длинных слов отрезаем: «анализу» и «анализ» должны находить друг друга
+        words = re.findall(r"\w+", text.lower())
+        stems = [w[:max(5, len(w) - 3)] for w in words]
+        return f" {operator} ".join(f'"{w}"*' for w in stems)
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, List, Optional
+
+import openai
+
+from app.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.config import Config
+from app.rate_limiter import RateLimiter
+from app.shared_state import SharedState
+from app.tracing import Tracer
+from app.traffic import Traffic
+from app.usage import Usage
+
+logger = logging.getLogger(__name__)
+
+client = openai.OpenAI(
+    base_url=Config.OPENROUTER_BASE_URL,
+    api_key=Config.OPENROUTER_API_KEY,
+    timeout=Config.LLM_TIMEOUT,
+    # Повторы делают агенты; скрытые повторы клиента держали бы слот и не доходили бы до автомата
+    max_retries=0
+)
+
+_bypass_cache: ContextVar[bool] = ContextVar("llm_bypass_cache", default=False)
+
+
+class LLM:
+    """
+    Единая точка обращения к провайдеру.
+    Ответы кэшируются в общем SQLite-хранилище — повторный одинаковый запрос
+    из любого воркера не оплачивается второй раз.
+    Пока провайдер неисправен (автомат разомкнут), запросы не отправляются:
+    отдаётся последний закэшированный ответ или CircuitOpenError, по которому
+    агенты сразу переходят к fallback-контенту.
+    Расход токенов каждого вызова записывается в текущий Usage-scope.
+    """
+
+    # Лимит параллельности делится между воркерами: в сумме не больше LLM_MAX_CONCURRENCY
+    _slots = threading.BoundedSemaphore(max(1, Config.LLM_MAX_CONCURRENCY // max(1, Config.WORKERS)))
+    breaker = CircuitBreaker("upstream")
+
+    @staticmethod
+    @contextmanager
+    def fresh():
+        """
+        Внутри блока (и в порождённых им задачах и потоках) ответы не берутся
+        из кэша — «сгенерировать заново» действительно обращается к модели.
+        Новые ответы в кэш записываются как обычно.
+        """
+        token = _bypass_cache.set(True)
+        try:
+            yield
+        finally:
+            _bypass_cache.reset(token)
+
+    @staticmethod
+    def available() -> bool:
+        return not LLM.breaker.is_open()
+
+    @staticmethod
+    def complete(
+        messages: List[dict],
+        agent: str = "unknown",
+        attempt: int = 0,
+        use_cache: bool = True,
+        validate: Optional[Callable[[str], object]] = None,
+        **params,
+    ) -> str:
+        """
+        Возвращает текст ответа модели.
+        attempt входит в ключ кэша: повторные попытки агентов после невалидного
+        ответа не должны получать из кэша тот же самый ответ.
+        validate — проверка агента (бросает исключение на невалидный ответ):
+        в кэш попадают и из кэша берутся только прошедшие её ответы,
+        иначе разовый сбой модели повторялся бы весь LLM_CACHE_TTL.
+        """
+        with Tracer.span(f"llm.{agent}", attempt=attempt):
+            return LLM._complete(messages, agent, attempt, use_cache, validate, **params)
+
+    @staticmethod
+    def _complete(
+        messages: List[dict],
+        agent: str,
+        attempt: int,
+        use_cache: bool,
+        validate: Optional[Callable[[str], object]],
+        **params,
+    ) -> str:
+        key = LLMCache.make_key(messages, attempt, params)
+
+        if use_cache and Config.LLM_CACHE_ENABLED and not _bypass_cache.get():
+            cached = LLMCache.get(key)
+            if cached is not None and not LLM._is_valid(cached, validate):
+                logger.warning(f"⚠ [{agent}] Ответ в кэше не проходит проверку агента → запрашиваем заново")
+                cached = None
+            if cached is not None:
+                logger.info(f"♻ [{agent}] Ответ LLM взят из кэша")
+                Usage.record(agent, cached=True)
+                return cached
+
+        # Пропуск автомата берём только после всех ожиданий (см. ниже); здесь — дешёвая проверка без пропуска
+        if LLM.breaker.is_open():
+            return LLM._stale_or_raise(key, agent, validate)
+
+        # Фоновый вызов уступает живым запросам и тратит свой бюджет — до того, как занять слот
+        if Traffic.is_background():
+            with Tracer.span("llm.background_wait"):
+                Traffic.take_turn()
+
+        # Общий бюджет сервиса: не больше LLM_MAX_CONCURRENCY запросов одновременно
+        # и не чаще LLM_RATE_LIMIT_RPM в минуту — для всех воркеров, тем и агентов сразу
+        with Tracer.span("llm.wait"):
+            LLM._slots.acquire()
+            try:
+                RateLimiter.acquire()
+            except Exception:
+                LLM._slots.release()
+                raise
+        try:
+            # Пропуск берём после ожидания слота и токена: пробный запрос half-open
+            # не простаивает в очереди, а разомкнувшийся за это время автомат не пустит запрос
+            if not LLM.breaker.allow():
+                return LLM._stale_or_raise(key, agent, validate)
+            recorded = False
+            try:
+                started = time.time()
+                try:
+                    with Tracer.span("llm.upstream", model=Config.MODEL_NAME):
+                        response = client.chat.completions.create(
+                            model=Config.MODEL_NAME,
+                            messages=messages,
+                            **params
+                        )
+                except Exception as e:
+                    recorded = True
+                    LLM.breaker.record_failure(e, time.time() - started)
+                    raise
+                recorded = True
+                LLM.breaker.record_success(time.time() - started)
+            finally:
+                if not recorded:
+                    LLM.breaker.release()
+        finally:
+            LLM._slots.release()
+        Usage.record(agent, response.usage)
+        content = response.choices[0].message.content or ""
+
+        if use_cache and Config.LLM_CACHE_ENABLED and content:
+            # Невалидный ответ не кэшируем: исключение проверки получит агент, как и раньше
+            if validate is not None:
+                validate(content)
+            LLMCache.put(key, content)
+
+        return content
+
+    @staticmethod
+    def _stale_or_raise(key: str, agent: str, validate: Optional[Callable[[str], object]]) -> str:
+        stale = LLMCache.get(key, ignore_ttl=True) if Config.LLM_CACHE_ENABLED else None
+        if stale is not None and LLM._is_valid(stale, validate):
+            logger.warning(f"🔴 [{agent}] Провайдер недоступен → устаревший ответ из кэша")
+            Usage.record(agent, cached=True)
+            return stale
+        raise CircuitOpenError("Провайдер недоступен (автомат разомкнут)")
+
+    @staticmethod
+    def _is_valid(content: str, validate: Optional[Callable[[str], object]]) -> bool:
+        if validate is None:
+            return True
+        try:
+            validate(content)
+            return True
+        except Exception:
+            return False
+
+
+class LLMCache:
+
+    @staticmethod
+    def make_key(messages: List[dict], attempt: int, params: dict) -> str:
+        raw = json.dumps(
+            {"model": Config.MODEL_NAME, "messages": messages, "attempt": attempt, "params": params},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    @Tracer.traced("cache.get")
+    def get(key: str, ignore_ttl: bool = False) -> Optional[str]:
+        try:
+            oldest = 0 if ignore_ttl else time.time() - Config.LLM_CACHE_TTL
+            row = SharedState.connection().execute(
+                "SELECT value FROM llm_cache WHERE key = ? AND created_at >= ?",
+                (key, oldest)
+            ).fetchone()
+            return row[0] if row else None
+        except Exception as e:
+            logger.error(f"❌ Ошибка чтения кэша LLM: {e}")
+            return None
+
+    @staticmethod
+    @Tracer.traced("cache.put")
+    def put(key: str, value: str):
+        try:
+            SharedState.connection().execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at) VALUES (?, ?, ?)",
+                (key, value, time.time())
+            )
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи кэша LLM: {e}")
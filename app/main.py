@@ -1,13 +1,32 @@
-from fastapi import FastAPI, HTTPException
+from typing import List, Optional, Union
+
+from fastapi import FastAPI, Depends, Header, HTTPException, Request, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
-from app.models import CourseRequest, FullCourse, TutorQuestion, TutorResponse, FormatRequest, FormatResponse
-from app.agents.course_generator import CourseGenerator
-from app.agents.content_generator import ContentGenerator
-from app.agents.quiz_generator import QuizGenerator
+from app.config import Config
+from app.models import (
+    CourseRequest, FullCourse, TutorQuestion, TutorResponse, FormatRequest, FormatResponse,
+    BatchRequest, BatchStatus, CourseOutline, LessonContent, Quiz, LibraryEntry
+)
 from app.agents.tutor_agent import TutorAgent
 from app.agents.content_formatter import ContentFormatter
+from app.course_store import CourseStore
+from app.job_registry import JobRegistry
+from app.pipeline import CoursePipeline
+from app.batch import BatchManager
+from app.llm import LLM
+from app.shared_state import SharedState
+from app.library import CourseLibrary
+from app.usage import Usage, UsageScope
+from app.traffic import Traffic
+from app.warmer import CacheWarmer
+from app.tracing import Tracer, Profiler
+from app.tutor_cache import TutorCache
+from app.responses import FastJSONResponse, json_payload_response, dump_json
+import asyncio
+import hmac
 import logging
 import time
+from contextlib import nullcontext
 
 # Настройка логирования
 logging.basicConfig(
@@ -16,7 +35,7 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Course Generator API")
+app = FastAPI(title="Course Generator API", default_response_class=FastJSONResponse)
 
 # CORS
 app.add_middleware(
@@ -24,65 +43,250 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "ETag", "X-Course-Id", "X-Course-Source",
+        "X-Usage-Tokens", "X-Usage-Prompt-Tokens", "X-Usage-Completion-Tokens", "X-Usage-Calls",
+    ],
 )
 
 
-@app.post("/generate-course", response_model=FullCourse)
-async def generate_course(request: CourseRequest):
+# Эндпоинты, обращающиеся к провайдеру: пока они выполняются, фоновый прогрев ждёт
+LIVE_PATHS = {"/generate-course", "/ask-tutor", "/format-content"}
+
+
+@app.middleware("http")
+async def track_live_traffic(request: Request, call_next):
+    if request.url.path not in LIVE_PATHS:
+        return await call_next(request)
+    with Traffic.live():
+        return await call_next(request)
+
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """
+    Трасса запроса (TRACE_ENABLED) и профилирование (после POST /admin/profile)
+    только для эндпоинтов, обращающихся к провайдеру (LIVE_PATHS).
+    В выключенном состоянии — две проверки флагов на запрос.
+    """
+    if not (Config.TRACE_ENABLED or Profiler.pending()) or request.url.path not in LIVE_PATHS:
+        return await call_next(request)
+    async with Profiler.request():
+        if not Config.TRACE_ENABLED:
+            return await call_next(request)
+        async with Tracer.trace(f"{request.method} {request.url.path}"):
+            return await call_next(request)
+
+
+def require_admin(x_admin_token: str = Header("")):
+    if not Config.ADMIN_TOKEN or not hmac.compare_digest(x_admin_token, Config.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Нет доступа")
+
+
+@app.on_event("startup")
+async def start_background_tasks():
+    app.state.purge = asyncio.create_task(SharedState.run_purge())
+    if Config.WARMER_ENABLED:
+        if Config.LIBRARY_ENABLED:
+            app.state.warmer = asyncio.create_task(CacheWarmer.run())
+        else:
+            logger.warning("⚠ Фоновый прогрев требует LIBRARY_ENABLED=1 → не запущен")
+
+
+async def run_blocking(func, *args):
+    """
+    Запись в общее хранилище может ждать чужую транзакцию до SHARED_DB_TIMEOUT —
+    выполняем её в пуле потоков, чтобы не останавливать остальные запросы воркера.
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+def course_response(
+    raw_request: Request,
+    course_id: str,
+    body: bytes,
+    etag: str,
+    view: str = "full",
+    source: str = "generated",
+    usage: Optional[UsageScope] = None,
+):
+    """
+    Ответ с курсом: целиком (view=full) или только структура со сводками глав (view=outline).
+    X-Course-Source: generated — только что создан, library — взят из библиотеки.
+    X-Usage-*: расход токенов на генерацию (USAGE_HEADERS).
+    """
+    headers = {"X-Course-Id": course_id, "X-Course-Source": source}
+    if usage is not None and Config.USAGE_HEADERS:
+        headers.update(usage.headers())
+    if view == "outline":
+        outline = CourseStore.outline(CourseStore.load(course_id))
+        return json_payload_response(raw_request, dump_json(outline), headers=headers)
+    return json_payload_response(raw_request, body, etag, headers=headers)
+
+
+# view=full — FullCourse, view=outline — CourseOutline
+@app.post("/generate-course", response_model=Union[FullCourse, CourseOutline])
+async def generate_course(
+    request: CourseRequest,
+    raw_request: Request,
+    view: str = Query("full", pattern="^(full|outline)$"),
+):
     start_time = time.time()
     logger.info(f"🚀 Начало генерации курса для темы: '{request.topic}'")
+    if Config.WARMER_ENABLED:
+        await run_blocking(CacheWarmer.record_request, request.topic)
+
+    # Курс по той же или очень похожей теме уже есть в библиотеке → отдаём сразу
+    if Config.LIBRARY_ENABLED and not request.force_new:
+        library_id = CourseLibrary.find_similar(request.topic)
+        entry = CourseStore.get(library_id) if library_id else None
+        if entry is not None:
+            logger.info(f"📚 Курс '{request.topic}' найден в библиотеке: {library_id}")
+            body, etag = entry
+            return course_response(raw_request, library_id, body, etag, view, source="library")
 
+    # Тот же курс уже генерируется в другом воркере → ждём его результат
+    job_key = CourseStore.normalize_topic(request.topic)
+    if not await run_blocking(JobRegistry.acquire, job_key):
+        logger.info(f"⏳ Курс '{request.topic}' уже генерируется другим воркером, ожидаем")
+        course_id = await JobRegistry.wait_for(job_key, timeout=Config.JOB_STALE_SECONDS)
+        entry = CourseStore.get(course_id) if course_id else None
+        if entry is not None:
+            body, etag = entry
+            return course_response(raw_request, course_id, body, etag, view)
+        logger.warning("⚠ Результат параллельной генерации недоступен → генерируем сами")
+        await run_blocking(JobRegistry.acquire, job_key)
+
+    course_id = None
     try:
-        # 1. Генерация структуры курса
-        logger.info("📋 Этап 1: Генерация структуры курса")
-        skeleton = CourseGenerator.generate_skeleton(request.topic)
-        logger.info(f"✅ Структура создана: {skeleton.title}")
-
-        # 2. Генерация контента для каждой главы
-        logger.info(f"📖 Этап 2: Генерация контента для {len(skeleton.chapters)} глав")
-        content = []
-        for i, chapter in enumerate(skeleton.chapters):
-            logger.info(f"🔹 Генерация контента для главы {i + 1}: {chapter.title}")
-            lesson_content = ContentGenerator.generate_lesson_content(chapter)
-            content.append(lesson_content)
-
-        # 3. Генерация тестов для каждой главы
-        logger.info("🎯 Этап 3: Генерация тестов")
-        quizzes = []
-        for i, lesson in enumerate(content):
-            logger.info(f"🔹 Генерация теста для главы {i + 1}: {lesson.chapter_title}")
-            quiz = QuizGenerator.generate_quiz(lesson)
-            quizzes.append(quiz)
-
-        result = FullCourse(
-            topic=request.topic,
-            skeleton=skeleton,
-            content=content,
-            quizzes=quizzes
-        )
+        # Бюджет курса: по исчерпании агенты сокращают попытки и размер тестов
+        # force_new: не только мимо библиотеки, но и мимо кэша ответов LLM
+        fresh = LLM.fresh() if request.force_new else nullcontext()
+        with fresh, Usage.scope("generate-course", Config.COURSE_TOKEN_BUDGET, Config.COURSE_TIME_BUDGET) as usage:
+            result = await CoursePipeline.generate(request.topic)
+            course_id, body, etag = await run_blocking(CourseStore.save, result)
+            usage.scope_id = course_id
+        if Config.LIBRARY_ENABLED:
+            await run_blocking(CourseLibrary.add, result)
 
         end_time = time.time()
         duration = end_time - start_time
         logger.info(f"✅ Курс успешно создан за {duration:.2f} секунд")
-        logger.info(f"📊 Итоги: {len(skeleton.chapters)} глав, {len(content)} уроков, {len(quizzes)} тестов")
 
-        return result
+        # Отдаём готовые bytes напрямую — без повторной валидации через response_model
+        return course_response(raw_request, course_id, body, etag, view, usage=usage)
 
     except Exception as e:
         logger.error(f"❌ Критическая ошибка при генерации курса: {str(e)}")
         logger.exception(e)
         raise HTTPException(status_code=500, detail=str(e))
 
+    finally:
+        await run_blocking(JobRegistry.release, job_key, course_id)
+
+
+@app.get("/courses/{course_id}", response_model=FullCourse)
+async def get_course(course_id: str, raw_request: Request):
+    """
+    Повторная выдача сохранённого курса.
+    Поддерживает If-None-Match → 304 и сжатие br/gzip.
+    """
+    entry = CourseStore.get(course_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Курс не найден")
+
+    body, etag = entry
+    return json_payload_response(
+        raw_request,
+        body,
+        etag,
+        cache_control=Config.COURSE_CACHE_CONTROL,
+        headers={"X-Course-Id": course_id},
+    )
+
+
+def load_course_or_404(course_id: str) -> FullCourse:
+    course = CourseStore.load(course_id)
+    if course is None:
+        raise HTTPException(status_code=404, detail="Курс не найден")
+    return course
+
+
+@app.get("/courses/{course_id}/outline", response_model=CourseOutline)
+async def get_course_outline(course_id: str, raw_request: Request):
+    """
+    Структура курса и краткие сводки глав — первая загрузка просмотрщика.
+    Уроки и тесты подгружаются по мере раскрытия глав.
+    """
+    outline = CourseStore.outline(load_course_or_404(course_id))
+    return json_payload_response(raw_request, dump_json(outline), cache_control=Config.COURSE_CACHE_CONTROL)
+
+
+@app.get("/courses/{course_id}/lessons/{index}", response_model=LessonContent)
+async def get_course_lesson(course_id: str, index: int, raw_request: Request):
+    course = load_course_or_404(course_id)
+    if not 0 <= index < len(course.content):
+        raise HTTPException(status_code=404, detail="Глава не найдена")
+    return json_payload_response(
+        raw_request, dump_json(course.content[index]), cache_control=Config.COURSE_CACHE_CONTROL
+    )
+
+
+@app.get("/courses/{course_id}/quizzes/{index}", response_model=Quiz)
+async def get_course_quiz(course_id: str, index: int, raw_request: Request):
+    course = load_course_or_404(course_id)
+    if not 0 <= index < len(course.quizzes):
+        raise HTTPException(status_code=404, detail="Тест не найден")
+    return json_payload_response(
+        raw_request, dump_json(course.quizzes[index]), cache_control=Config.COURSE_CACHE_CONTROL
+    )
+
+
+@app.get("/library/search", response_model=List[LibraryEntry])
+async def search_library(q: str = Query(..., min_length=2), limit: int = Query(10, ge=1, le=50)):
+    """
+    Полнотекстовый поиск по библиотеке готовых курсов:
+    темы, названия курсов и глав, текст уроков.
+    """
+    logger.info(f"🔎 Поиск в библиотеке: '{q}'")
+    return CourseLibrary.search(q, limit)
+
+
+@app.post("/batch", response_model=BatchStatus, status_code=202)
+async def start_batch(request: BatchRequest):
+    """
+    Запускает пакетную генерацию каталога в фоне.
+    Прогресс — GET /batch/{batch_id}, результат — JSONL.gz на диске сервера.
+    """
+    if not request.topics:
+        raise HTTPException(status_code=400, detail="Список тем пуст")
+
+    batch_id = BatchManager.start(request.topics)
+    logger.info(f"📦 Пакетная генерация запущена: {batch_id}")
+    return BatchManager.status(batch_id)
+
+
+@app.get("/batch/{batch_id}", response_model=BatchStatus)
+async def get_batch(batch_id: str):
+    status = BatchManager.status(batch_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Пакет не найден")
+    return status
+
 
 @app.post("/ask-tutor", response_model=TutorResponse)
-async def ask_tutor(question: TutorQuestion):
+async def ask_tutor(question: TutorQuestion, raw_response: Response):
     logger.info(f"🤖 Запрос к репетитору: '{question.question}'")
 
     try:
-        response = TutorAgent.answer_question(
-            question.question,
-            question.course_content
-        )
+        with Usage.scope("ask-tutor") as usage:
+            response = TutorAgent.answer_question(
+                question.question,
+                question.course_content
+            )
+        if Config.USAGE_HEADERS:
+            raw_response.headers.update(usage.headers())
         logger.info("✅ Ответ репетитора готов")
         return response
     except Exception as e:
@@ -92,7 +296,7 @@ async def ask_tutor(question: TutorQuestion):
 
 
 @app.post("/format-content", response_model=FormatResponse)
-async def format_content(request: FormatRequest):
+async def format_content(request: FormatRequest, raw_response: Response):
     """
     Отдельный эндпоинт для форматирования контента
     Полезен для отладки и переформатирования существующего контента
@@ -100,7 +304,10 @@ async def format_content(request: FormatRequest):
     logger.info("🎨 Запрос на форматирование контента")
 
     try:
-        response = ContentFormatter.format_content(request.content)
+        with Usage.scope("format-content") as usage:
+            response = ContentFormatter.format_content(request.content)
+        if Config.USAGE_HEADERS:
+            raw_response.headers.update(usage.headers())
         logger.info("✅ Контент отформатирован")
         return response
     except Exception as e:
@@ -108,6 +315,29 @@ async def format_content(request: FormatRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/usage")
+async def usage_report(since: float = Query(0, ge=0)):
+    """
+    Расход токенов по эндпоинтам и агентам начиная с момента since (unix time).
+    """
+    return Usage.report(since)
+
+
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def start_profiling(requests: int = Query(10, ge=1, le=1000)):
+    """
+    Включает сэмплирующий профилировщик на следующие requests запросов к LLM-эндпоинтам (LIVE_PATHS).
+    Стеки для flame graph сохраняются в TRACE_DIR/profile-*.folded.
+    """
+    Profiler.enable(requests)
+    return Profiler.status()
+
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def profiling_status():
+    return Profiler.status()
+
+
 @app.get("/")
 async def root():
     logger.info("📡 Получен запрос к корневому эндпоинту")
@@ -117,11 +347,19 @@ async def root():
 @app.get("/health")
 async def health_check():
     logger.debug("🔍 Health check")
-    return {"status": "healthy", "service": "Course Generator API"}
+    upstream = LLM.breaker.snapshot()
+    return {
+        "status": "healthy" if upstream["state"] == "closed" else "degraded",
+        "service": "Course Generator API",
+        "upstream": upstream,
+        "tutor_cache": TutorCache.stats(),
+    }
 
 
 if __name__ == "__main__":
     import uvicorn
 
-    logger.info("🚀 Запуск сервера Course Generator API")
-    uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
\ No newline at end of file
+    logger.info(f"🚀 Запуск сервера Course Generator API (воркеров: {Config.WORKERS})")
+    # Строка импорта нужна uvicorn для запуска нескольких процессов;
+    # кэш, курсы и реестр задач воркеры делят через SQLite (см. app/shared_state.py)
+    uvicorn.run("app.main:app", host=Config.HOST, port=Config.PORT, workers=Config.WORKERS, log_level="info")
\ No newline at end of file
@@ -3,6 +3,7 @@ from typing import List, Dict, Optional
 
 class CourseRequest(BaseModel):
     topic: str
+    force_new: bool = False
 
 class Chapter(BaseModel):
     title: str
@@ -12,11 +13,15 @@ class CourseSkeleton(BaseModel):
     title: str
     description: str
     chapters: List[Chapter]
+    fallback: bool = False  # структура-заглушка: модель не ответила
 
 class LessonContent(BaseModel):
     chapter_title: str
     content: str
     key_points: List[str]
+    html: Optional[str] = None
+    render_issues: List[str] = []
+    fallback: bool = False  # весь урок или часть его разделов — заглушка
 
 class Question(BaseModel):
     question: str
@@ -27,6 +32,7 @@ class Question(BaseModel):
 class Quiz(BaseModel):
     chapter_title: str
     questions: List[Question]
+    fallback: bool = False  # тест-заглушка
 
 class TutorQuestion(BaseModel):
     question: str
@@ -42,8 +48,42 @@ class FormatRequest(BaseModel):
 class FormatResponse(BaseModel):
     formatted_content: str
 
+class ChapterSummary(BaseModel):
+    index: int
+    chapter_title: str
+    description: str
+    excerpt: str
+    key_points: List[str]
+    content_length: int
+    question_count: int
+
+class CourseOutline(BaseModel):
+    course_id: str
+    topic: str
+    skeleton: CourseSkeleton
+    chapters: List[ChapterSummary]
+
 class FullCourse(BaseModel):
+    course_id: Optional[str] = None
     topic: str
     skeleton: CourseSkeleton
     content: List[LessonContent]
-    quizzes: List[Quiz]
\ No newline at end of file
+    quizzes: List[Quiz]
+
+class BatchRequest(BaseModel):
+    topics: List[str]
+
+class BatchStatus(BaseModel):
+    batch_id: str
+    total: int
+    completed: int
+    failed: List[str]
+    finished: bool
+    output: str
+
+class LibraryEntry(BaseModel):
+    course_id: str
+    topic: str
+    title: str
+    snippet: str
+    created_at: float
\ No newline at end of file
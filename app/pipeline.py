@@ -0,0 +1,83 @@
+import asyncio
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
+
+from app.config import Config
+from app.tracing import Tracer
+from app.traffic import Traffic
+from app.models import FullCourse, Chapter, LessonContent, Quiz
+from app.agents.course_generator import CourseGenerator
+from app.agents.content_generator import ContentGenerator
+from app.agents.quiz_generator import QuizGenerator
+
+logger = logging.getLogger(__name__)
+
+
+class CoursePipeline:
+    """
+    Генерация курса: структура → (урок → форматирование → тест) для каждой главы.
+    Агенты синхронные, поэтому работают в общем пуле потоков; главы одного курса
+    и курсы разных тем идут параллельно. Общий лимит одновременных запросов
+    и частоты обращений к провайдеру соблюдает app.llm.LLM.
+    """
+
+    _executor = ThreadPoolExecutor(max_workers=Config.PIPELINE_THREADS, thread_name_prefix="pipeline")
+
+    @staticmethod
+    async def _run(func, *args):
+        # Фоновая генерация (прогрев) перед каждым этапом уступает живым запросам и резервирует вызов LLM
+        if Traffic.is_background():
+            await Traffic.wait_turn()
+        loop = asyncio.get_running_loop()
+        # run_in_executor не переносит contextvars в поток — переносим сами,
+        # иначе расход токенов агентов не попадёт в Usage-scope курса
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(CoursePipeline._executor, context.run, func, *args)
+
+    @staticmethod
+    async def generate(topic: str) -> FullCourse:
+        start_time = time.time()
+
+        # 1. Генерация структуры курса
+        logger.info(f"📋 Этап 1: Генерация структуры курса '{topic}'")
+        with Tracer.span("stage.skeleton", topic=topic):
+            skeleton = await CoursePipeline._run(CourseGenerator.generate_skeleton, topic)
+        logger.info(f"✅ Структура создана: {skeleton.title}")
+
+        # 2–3. Контент и тест каждой главы — все главы параллельно
+        logger.info(f"📖 Этапы 2–3: Контент и тесты для {len(skeleton.chapters)} глав")
+        results = await asyncio.gather(*[
+            CoursePipeline._generate_chapter(i, chapter)
+            for i, chapter in enumerate(skeleton.chapters)
+        ])
+        content = [lesson for lesson, _ in results]
+        quizzes = [quiz for _, quiz in results]
+
+        # Все части уже провалидированы агентами — повторная валидация не нужна
+        result = FullCourse.model_construct(
+            course_id=None,
+            topic=topic,
+            skeleton=skeleton,
+            content=content,
+            quizzes=quizzes
+        )
+
+        duration = time.time() - start_time
+        logger.info(f"✅ Курс '{topic}' создан за {duration:.2f} секунд")
+        logger.info(f"📊 Итоги: {len(skeleton.chapters)} глав, {len(content)} уроков, {len(quizzes)} тестов")
+        return result
+
+    @staticmethod
+    async def _generate_chapter(index: int, chapter: Chapter) -> Tuple[LessonContent, Quiz]:
+        logger.info(f"🔹 Генерация контента для главы {index + 1}: {chapter.title}")
+        with Tracer.span("stage.lesson", chapter=index + 1):
+            lesson = await CoursePipeline._run(ContentGenerator.generate_lesson_content, chapter)
+
+        logger.info(f"🔹 Генерация теста для главы {index + 1}: {lesson.chapter_title}")
+        with Tracer.span("stage.quiz", chapter=index + 1):
+            quiz = await CoursePipeline._run(QuizGenerator.generate_quiz, lesson)
+
+        return lesson, quiz
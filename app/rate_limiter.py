@@ -0,0 +1,57 @@
+import time
+
+from app.config import Config
+from app.shared_state import SharedState
+
+
+class RateLimiter:
+    """
+    Token bucket'ы, общие для всех воркеров: состояние каждого ведра — строка rate_limits в SharedState.
+    → "llm" — все запросы к провайдеру, LLM_RATE_LIMIT_RPM в минуту (0 — без ограничения)
+    → "warmer" — фоновые запросы прогрева, WARMER_RATE_LIMIT_RPM (см. app.traffic)
+    """
+
+    LLM = "llm"
+    WARMER = "warmer"
+
+    @staticmethod
+    def acquire():
+        rate = Config.LLM_RATE_LIMIT_RPM
+        if rate <= 0:
+            return
+
+        while True:
+            wait = RateLimiter.take(RateLimiter.LLM, rate)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    @staticmethod
+    def take(name: str, rate: int) -> float:
+        """Списывает токен из ведра name, если он есть. Возвращает 0 или сколько секунд ждать следующего."""
+        per_second = rate / 60.0
+        now = time.time()
+        conn = SharedState.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM rate_limits WHERE name = ?",
+                (name,)
+            ).fetchone()
+            tokens = float(rate) if row is None else min(float(rate), row[0] + max(0.0, now - row[1]) * per_second)
+
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / per_second
+
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limits (name, tokens, updated_at) VALUES (?, ?, ?)",
+                (name, tokens, now)
+            )
+            conn.execute("COMMIT")
+            return wait
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
@@ -0,0 +1,240 @@
+import hashlib
+import html as html_lib
+import json
+import logging
+import re
+import time
+from html.parser import HTMLParser
+from typing import List, Optional, Tuple
+
+from app.shared_state import SharedState
+from app.tracing import Tracer
+
+try:
+    from markdown_it import MarkdownIt
+    from mdit_py_plugins.dollarmath import dollarmath_plugin
+    from latex2mathml.converter import convert as latex_to_mathml
+except ImportError:  # пререндер необязателен — без этих пакетов фронтенд рендерит сам
+    MarkdownIt = None
+
+logger = logging.getLogger(__name__)
+
+
+class LessonRenderer:
+    """
+    Серверный пререндер урока: Markdown + LaTeX → готовый HTML.
+    → сырой HTML из текста не пропускается (html=False), опасные ссылки отсекает markdown-it
+    → формулы превращаются в MathML, который браузер рисует сам, без KaTeX
+    → формулы, которые не удалось отрисовать, выбрасываются и попадают в список проблем
+    → итоговый HTML проходит allowlist-санитайзер (теги Markdown и MathML, без on*-атрибутов):
+      latex2mathml не экранирует содержимое \\text{…}
+    → результат кэшируется в общем хранилище по хэшу исходного текста
+    """
+
+    # Таблицы вне ```table удаляются так же, как в ContentFormatter._postprocess
+    TABLE_ROW_RE = re.compile(r"^\s*\|.*\|\s*$", re.MULTILINE)
+    TABLE_FENCE_RE = re.compile(r"```table\n([\s\S]*?)\n```")
+
+    @staticmethod
+    def available() -> bool:
+        return MarkdownIt is not None
+
+    @staticmethod
+    @Tracer.traced("render.html")
+    def render(markdown: str) -> Tuple[Optional[str], List[str]]:
+        """
+        Возвращает (html, проблемы). html = None, если пререндер недоступен.
+        """
+        if not LessonRenderer.available():
+            logger.warning("⚠ Пререндер недоступен: не установлены markdown-it-py / mdit-py-plugins / latex2mathml")
+            return None, []
+
+        key = hashlib.sha256(markdown.encode("utf-8")).hexdigest()
+        cached = LessonRenderer._cache_get(key)
+        if cached is not None:
+            logger.debug("♻ HTML урока взят из кэша")
+            return cached
+
+        html, issues = LessonRenderer._render(markdown)
+        LessonRenderer._cache_put(key, html, issues)
+        return html, issues
+
+    # ================================================================
+    # RENDER
+    # ================================================================
+    @staticmethod
+    def _render(markdown: str) -> Tuple[str, List[str]]:
+        issues: List[str] = []
+
+        def render_math(latex: str, options: dict) -> str:
+            display = options.get("display_mode", False)
+            try:
+                mathml = latex_to_mathml(latex.strip(), display="block" if display else "inline")
+            except Exception as e:
+                issues.append(f"Формула не отрисована: {latex.strip()[:80]} ({type(e).__name__})")
+                return ""
+            # latex2mathml пропускает неизвестные команды как текст <mi>\cmd</mi>
+            unknown = re.findall(r"<mi>(\\[A-Za-z]+)</mi>", mathml)
+            if unknown:
+                issues.append(f"Неизвестные команды LaTeX {', '.join(sorted(set(unknown)))}: {latex.strip()[:80]}")
+                return ""
+            return mathml
+
+        md = (
+            MarkdownIt("commonmark", {"html": False})
+            .enable("table")
+            .use(dollarmath_plugin, allow_labels=False, double_inline=True, renderer=render_math)
+        )
+
+        text = markdown
+
+        # Разрешённые таблицы (```table) рендерим как обычные таблицы, остальные удаляем
+        parts = []
+        last = 0
+        for match in LessonRenderer.TABLE_FENCE_RE.finditer(text):
+            parts.append(LessonRenderer.TABLE_ROW_RE.sub("", text[last:match.start()]))
+            parts.append(f"\n\n{match.group(1)}\n\n")
+            last = match.end()
+        parts.append(LessonRenderer.TABLE_ROW_RE.sub("", text[last:]))
+        text = "".join(parts)
+
+        html = HtmlSanitizer.clean(md.render(text))
+
+        for issue in issues:
+            logger.warning(f"⚠ {issue}")
+        return html, issues
+
+    # ================================================================
+    # CACHE
+    # ================================================================
+    @staticmethod
+    def _cache_get(key: str) -> Optional[Tuple[str, List[str]]]:
+        try:
+            row = SharedState.connection().execute(
+                "SELECT html, issues FROM render_cache WHERE key = ?",
+                (key,)
+            ).fetchone()
+            return (row[0], json.loads(row[1])) if row else None
+        except Exception as e:
+            logger.error(f"❌ Ошибка чтения кэша рендера: {e}")
+            return None
+
+    @staticmethod
+    def _cache_put(key: str, html: str, issues: List[str]):
+        try:
+            SharedState.connection().execute(
+                "INSERT OR REPLACE INTO render_cache (key, html, issues, created_at) VALUES (?, ?, ?, ?)",
+                (key, html, json.dumps(issues, ensure_ascii=False), time.time())
+            )
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи кэша рендера: {e}")
+
+
+class HtmlSanitizer(HTMLParser):
+    """
+    Пересобирает HTML, оставляя только разрешённые теги и атрибуты.
+    Неизвестные теги выбрасываются (их текст остаётся, кроме script/style),
+    текст и значения атрибутов экранируются заново.
+    """
+
+    MARKDOWN_TAGS = {
+        "p", "h1", "h2", "h3", "h4", "h5", "h6", "em", "strong", "code", "pre", "blockquote",
+        "ul", "ol", "li", "a", "img", "hr", "br", "table", "thead", "tbody", "tr", "th", "td",
+    }
+    MATHML_TAGS = {
+        "math", "semantics", "annotation", "mrow", "mi", "mn", "mo", "ms", "mtext", "mspace",
+        "mfrac", "msqrt", "mroot", "mstyle", "merror", "mpadded", "mphantom", "mfenced", "menclose",
+        "msub", "msup", "msubsup", "munder", "mover", "munderover", "mmultiscripts", "mprescripts",
+        "none", "mtable", "mtr", "mtd", "mlabeledtr",
+    }
+    VOID_TAGS = {"img", "hr", "br", "mspace", "mprescripts", "none"}
+    DROP_CONTENT_TAGS = {"script", "style"}
+
+    ATTRIBUTES = {
+        "a": {"href", "title"},
+        "img": {"src", "alt", "title"},
+        "ol": {"start"},
+        "code": {"class"},
+        "th": {"style"},
+        "td": {"style"},
+    }
+    MATHML_ATTRIBUTES = {
+        "xmlns", "display", "mathvariant", "stretchy", "fence", "separator", "separators", "lspace",
+        "rspace", "width", "height", "depth", "columnalign", "rowalign", "columnspacing", "rowspacing",
+        "columnlines", "rowlines", "frame", "linethickness", "accent", "accentunder", "movablelimits",
+        "minsize", "maxsize", "symmetric", "largeop", "form", "open", "close", "notation",
+        "scriptlevel", "displaystyle", "encoding",
+    }
+    SAFE_URL_RE = re.compile(r"^(https?:|mailto:|#|/(?!/)|[^:/?#]*(?:[/?#]|$))", re.IGNORECASE)
+    SAFE_STYLE_RE = re.compile(r"^text-align:\s*(left|right|center)$")
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out: List[str] = []
+        self.open_tags: List[str] = []
+        self.dropping = 0
+
+    @staticmethod
+    def clean(html: str) -> str:
+        sanitizer = HtmlSanitizer()
+        sanitizer.feed(html)
+        sanitizer.close()
+        # Незакрытые теги закрываем, чтобы разметка урока не «протекала» в страницу
+        for tag in reversed(sanitizer.open_tags):
+            sanitizer.out.append(f"</{tag}>")
+        return "".join(sanitizer.out)
+
+    def _allowed(self, tag: str) -> bool:
+        return tag in HtmlSanitizer.MARKDOWN_TAGS or tag in HtmlSanitizer.MATHML_TAGS
+
+    def _attributes(self, tag: str, attrs) -> str:
+        allowed = HtmlSanitizer.ATTRIBUTES.get(tag, set())
+        if tag in HtmlSanitizer.MATHML_TAGS:
+            allowed = allowed | HtmlSanitizer.MATHML_ATTRIBUTES
+
+        result = []
+        for name, value in attrs:
+            value = value or ""
+            if name not in allowed:
+                continue
+            if name in ("href", "src") and not HtmlSanitizer.SAFE_URL_RE.match(value.strip()):
+                continue
+            if name == "style" and not HtmlSanitizer.SAFE_STYLE_RE.match(value.strip()):
+                continue
+            result.append(f' {name}="{html_lib.escape(value, quote=True)}"')
+        return "".join(result)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in HtmlSanitizer.DROP_CONTENT_TAGS:
+            self.dropping += 1
+            return
+        if self.dropping or not self._allowed(tag):
+            return
+        self.out.append(f"<{tag}{self._attributes(tag, attrs)}>")
+        if tag not in HtmlSanitizer.VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        if self.dropping or not self._allowed(tag):
+            return
+        if tag in HtmlSanitizer.VOID_TAGS:
+            self.out.append(f"<{tag}{self._attributes(tag, attrs)}>")
+        else:
+            self.out.append(f"<{tag}{self._attributes(tag, attrs)}></{tag}>")
+
+    def handle_endtag(self, tag):
+        if tag in HtmlSanitizer.DROP_CONTENT_TAGS:
+            self.dropping = max(0, self.dropping - 1)
+            return
+        if self.dropping or tag not in self.open_tags:
+            return
+        # Закрываем всё, что осталось открытым внутри этого тега
+        while self.open_tags:
+            current = self.open_tags.pop()
+            self.out.append(f"</{current}>")
+            if current == tag:
+                break
+
+    def handle_data(self, data):
+        if not self.dropping:
+            self.out.append(html_lib.escape(data, quote=False))
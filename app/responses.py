@@ -0,0 +1,130 @@
+import gzip
+import hashlib
+import logging
+from typing import Any, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+from pydantic_core import to_json
+
+from app.config import Config
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен — без него работает pydantic_core
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен — без него отдаём только gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON-ответ без лишних копий (наследник JSONResponse — иначе FastAPI
+    не выводит схемы response_model в OpenAPI):
+    → pydantic-модели сериализуются напрямую в bytes через pydantic_core
+    → остальное — через orjson (если установлен)
+    → уже готовые bytes отдаются как есть
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dump_json(content)
+
+
+def dump_json(content: Any) -> bytes:
+    if isinstance(content, bytes):
+        return content
+    if isinstance(content, BaseModel):
+        return to_json(content)
+    if orjson is not None:
+        return orjson.dumps(content)
+    return to_json(content)
+
+
+def make_etag(body: bytes) -> str:
+    # Weak ETag: одно и то же представление может уходить и сжатым, и несжатым
+    return f'W/"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Сравнение weak-тегов: префикс W/ не учитываем
+    wanted = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == wanted:
+            return True
+    return False
+
+
+def compress(body: bytes, accept_encoding: str) -> Tuple[bytes, Optional[str]]:
+    """
+    Выбирает кодировку по Accept-Encoding: br → gzip → без сжатия.
+    Маленькие тела не сжимаем — заголовки дороже выигрыша.
+    """
+    if len(body) < Config.COMPRESSION_MIN_SIZE:
+        return body, None
+
+    accepted = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            accepted.add(name)
+
+    if brotli is not None and "br" in accepted:
+        return brotli.compress(body, quality=Config.BROTLI_QUALITY), "br"
+    if "gzip" in accepted:
+        return gzip.compress(body, compresslevel=Config.GZIP_LEVEL), "gzip"
+    return body, None
+
+
+def json_payload_response(
+    request: Request,
+    body: bytes,
+    etag: Optional[str] = None,
+    cache_control: Optional[str] = None,
+    headers: Optional[dict] = None,
+) -> Response:
+    """
+    Отдаёт уже сериализованный JSON:
+    → 304 Not Modified, если клиент прислал совпадающий If-None-Match
+    → иначе тело, сжатое br/gzip по Accept-Encoding
+    """
+    etag = etag or make_etag(body)
+    response_headers = {"ETag": etag, "Vary": "Accept-Encoding"}
+    if cache_control:
+        response_headers["Cache-Control"] = cache_control
+    if headers:
+        response_headers.update(headers)
+
+    if etag_matches(request, etag):
+        logger.debug(f"♻ 304 Not Modified для {request.url.path}")
+        return Response(status_code=304, headers=response_headers)
+
+    payload, encoding = compress(body, request.headers.get("accept-encoding", ""))
+    if encoding:
+        response_headers["Content-Encoding"] = encoding
+        logger.debug(f"🗜 {request.url.path}: {len(body)} → {len(payload)} байт ({encoding})")
+
+    return FastJSONResponse(content=payload, headers=response_headers)
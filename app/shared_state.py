@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class SharedState:
+    """
+    Общее между воркерами состояние на SQLite в режиме WAL.
+    → кэш ответов LLM
+    → хранилище готовых курсов
+    → реестр генераций «в процессе»
+    → кэш пререндера уроков в HTML
+    → библиотека курсов с полнотекстовым индексом (FTS5)
+    → журнал расхода токенов по запросам и агентам
+    → популярность тем для фонового прогрева
+    → общий для воркеров лимит частоты запросов к провайдеру
+    → живые запросы каждого воркера (фоновая работа ждёт простоя всего сервиса)
+    Каждый поток каждого процесса держит своё соединение; WAL позволяет
+    читать параллельно с записью, а busy_timeout сглаживает конкуренцию писателей.
+    Кэши и журналы чистятся по сроку (purge) — иначе база растёт без ограничений.
+    """
+
+    _local = threading.local()
+    _init_lock = threading.Lock()
+    _initialized_pid = None
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS llm_cache (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        created_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS courses (
+        course_id TEXT PRIMARY KEY,
+        topic_key TEXT NOT NULL,
+        body BLOB NOT NULL,
+        etag TEXT NOT NULL,
+        created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_courses_created ON courses(created_at);
+    CREATE TABLE IF NOT EXISTS jobs (
+        job_key TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        status TEXT NOT NULL,
+        course_id TEXT,
+        started_at REAL NOT NULL,
+        finished_at REAL
+    );
+    CREATE TABLE IF NOT EXISTS render_cache (
+        key TEXT PRIMARY KEY,
+        html TEXT NOT NULL,
+        issues TEXT NOT NULL,
+        created_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS library (
+        course_id TEXT PRIMARY KEY,
+        topic TEXT NOT NULL,
+        topic_key TEXT NOT NULL,
+        title TEXT NOT NULL,
+        created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_library_topic_key ON library(topic_key);
+    CREATE VIRTUAL TABLE IF NOT EXISTS library_fts USING fts5(
+        course_id UNINDEXED,
+        topic,
+        title,
+        chapter_titles,
+        lesson_text,
+        tokenize = 'unicode61 remove_diacritics 2'
+    );
+    CREATE TABLE IF NOT EXISTS usage_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        scope_id TEXT NOT NULL,
+        endpoint TEXT NOT NULL,
+        agent TEXT NOT NULL,
+        calls INTEGER NOT NULL,
+        cached_calls INTEGER NOT NULL,
+        prompt_tokens INTEGER NOT NULL,
+        completion_tokens INTEGER NOT NULL,
+        total_tokens INTEGER NOT NULL,
+        duration REAL NOT NULL,
+        created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_usage_created ON usage_log(created_at);
+    CREATE TABLE IF NOT EXISTS topic_stats (
+        topic_key TEXT PRIMARY KEY,
+        topic TEXT NOT NULL,
+        score REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        warmed_at REAL
+    );
+    CREATE TABLE IF NOT EXISTS rate_limits (
+        name TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS live_traffic (
+        worker TEXT PRIMARY KEY,
+        live INTEGER NOT NULL,
+        last_live_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    """
+
+    @staticmethod
+    def connection() -> sqlite3.Connection:
+        conn = getattr(SharedState._local, "conn", None)
+        # После fork соединение родителя использовать нельзя
+        if conn is not None and SharedState._local.pid == os.getpid():
+            return conn
+
+        SharedState._ensure_schema()
+        conn = SharedState._connect()
+        SharedState._local.conn = conn
+        SharedState._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _connect() -> sqlite3.Connection:
+        directory = os.path.dirname(Config.SHARED_DB_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = sqlite3.connect(
+            Config.SHARED_DB_PATH,
+            timeout=Config.SHARED_DB_TIMEOUT,
+            isolation_level=None,  # autocommit, транзакции — явно через BEGIN
+            check_same_thread=False,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(Config.SHARED_DB_TIMEOUT * 1000)}")
+        return conn
+
+    @staticmethod
+    def _ensure_schema():
+        with SharedState._init_lock:
+            if SharedState._initialized_pid == os.getpid():
+                return
+            conn = SharedState._connect()
+            try:
+                conn.executescript(SharedState.SCHEMA)
+            finally:
+                conn.close()
+            SharedState._initialized_pid = os.getpid()
+            logger.info(f"🗄 Общее хранилище готово: {Config.SHARED_DB_PATH}")
+
+    # ================================================================
+    # PURGE
+    # ================================================================
+    @staticmethod
+    def purge() -> dict:
+        """
+        Удаляет записи старше своего срока хранения. Возвращает число удалённых строк по таблицам.
+        Устаревшие ответы LLM хранятся дольше LLM_CACHE_TTL — они нужны, пока автомат разомкнут,
+        но не дольше LLM_CACHE_MAX_AGE.
+        """
+        now = time.time()
+        limits = {
+            "llm_cache": ("created_at", max(Config.LLM_CACHE_TTL, Config.LLM_CACHE_MAX_AGE)),
+            "render_cache": ("created_at", Config.RENDER_CACHE_MAX_AGE),
+            "usage_log": ("created_at", Config.USAGE_LOG_MAX_AGE),
+            # Записи завершившихся или упавших воркеров
+            "live_traffic": ("updated_at", Config.JOB_STALE_SECONDS),
+        }
+        conn = SharedState.connection()
+        removed = {}
+        for table, (column, max_age) in limits.items():
+            removed[table] = conn.execute(
+                f"DELETE FROM {table} WHERE {column} < ?",
+                (now - max_age,)
+            ).rowcount
+        return removed
+
+    @staticmethod
+    async def run_purge():
+        logger.info(f"🧹 Очистка общего хранилища: каждые {Config.SHARED_DB_PURGE_INTERVAL:.0f} сек")
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                removed = await loop.run_in_executor(None, SharedState.purge)
+                if any(removed.values()):
+                    logger.info(f"🧹 Удалено устаревших записей: {removed}")
+            except Exception as e:
+                logger.error(f"❌ Ошибка очистки общего хранилища: {e}")
+            await asyncio.sleep(Config.SHARED_DB_PURGE_INTERVAL)
@@ -0,0 +1,249 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Optional
+
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class Trace:
+    """События одного запроса в формате Chrome Trace Event (ph = "X")."""
+
+    def __init__(self, name: str):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.events = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, start: float, end: float, args: dict):
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": int(start * 1_000_000),
+            "dur": int((end - start) * 1_000_000),
+            "pid": os.getpid(),
+            "tid": Tracer._lane(),
+            "args": args,
+        }
+        with self._lock:
+            self.events.append(event)
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+_NULL_SPAN = nullcontext()
+
+
+class Tracer:
+    """
+    Трассировка запросов: вложенные спаны этапов, вызовов агентов и попыток.
+    → трасса запроса пишется в TRACE_DIR/<trace_id>.json (chrome://tracing, Perfetto)
+      в потоке пула, а не в цикле событий; хранятся последние TRACE_MAX_FILES трасс
+    → спаны из потоков пула попадают в трассу через скопированный контекст
+    → без активной трассы span() возвращает общий пустой контекст —
+      накладные расходы сводятся к чтению одной contextvar
+    """
+
+    @staticmethod
+    def enabled() -> bool:
+        return Config.TRACE_ENABLED
+
+    @staticmethod
+    @asynccontextmanager
+    async def trace(name: str):
+        trace = Trace(name)
+        token = _current_trace.set(trace)
+        start = time.time()
+        try:
+            yield trace
+        finally:
+            trace.add(name, start, time.time(), {"trace_id": trace.trace_id})
+            _current_trace.reset(token)
+            await asyncio.get_running_loop().run_in_executor(None, Tracer._export, trace)
+
+    @staticmethod
+    def span(name: str, **args):
+        trace = _current_trace.get()
+        if trace is None:
+            return _NULL_SPAN
+        return Tracer._span(trace, name, args)
+
+    @staticmethod
+    @contextmanager
+    def _span(trace: Trace, name: str, args: dict):
+        start = time.time()
+        try:
+            yield
+        except BaseException as e:
+            args["error"] = type(e).__name__
+            raise
+        finally:
+            trace.add(name, start, time.time(), args)
+
+    @staticmethod
+    def traced(name: str):
+        """Декоратор: вызов функции — отдельный спан."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                trace = _current_trace.get()
+                if trace is None:
+                    return func(*args, **kwargs)
+                with Tracer._span(trace, name, {}):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def _lane() -> int:
+        # Параллельные корутины одного потока — на отдельных дорожках, иначе спаны глав перекрываются
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        return id(task) if task is not None else threading.get_ident()
+
+    @staticmethod
+    def _export(trace: Trace):
+        try:
+            os.makedirs(Config.TRACE_DIR, exist_ok=True)
+            path = os.path.join(Config.TRACE_DIR, f"{trace.trace_id}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"traceEvents": trace.events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+            logger.info(f"🧭 Трасса '{trace.name}' сохранена: {path}")
+            Tracer._prune()
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения трассы: {e}")
+
+    @staticmethod
+    def _prune():
+        # Удаляем самые старые трассы сверх TRACE_MAX_FILES
+        paths = [
+            os.path.join(Config.TRACE_DIR, name)
+            for name in os.listdir(Config.TRACE_DIR)
+            if name.endswith(".json")
+        ]
+        excess = len(paths) - Config.TRACE_MAX_FILES
+        if excess <= 0:
+            return
+        for path in sorted(paths, key=os.path.getmtime)[:excess]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # трассу уже удалил другой поток или воркер
+
+
+class Profiler:
+    """
+    Сэмплирующий профилировщик, включаемый на следующие N запросов.
+    Пока идёт хотя бы один профилируемый запрос, отдельный поток раз в
+    PROFILE_INTERVAL снимает стеки всех потоков (sys._current_frames).
+    После N-го запроса стеки сохраняются в collapsed-формате
+    (TRACE_DIR/profile-*.folded) для flamegraph.pl / speedscope.
+    Остановка потока и запись файла идут в пуле потоков, не блокируя цикл событий.
+    """
+
+    _lock = threading.Lock()
+    _remaining = 0
+    _active = 0
+    _stacks = Counter()
+    _thread: Optional[threading.Thread] = None
+    _stop = threading.Event()
+    last_dump: Optional[str] = None
+
+    @staticmethod
+    def enable(requests: int):
+        with Profiler._lock:
+            Profiler._remaining = requests
+            Profiler._stacks = Counter()
+        logger.info(f"🔬 Профилировщик включён на {requests} запросов")
+
+    @staticmethod
+    def pending() -> bool:
+        return Profiler._remaining > 0 or Profiler._active > 0
+
+    @staticmethod
+    def status() -> dict:
+        with Profiler._lock:
+            return {
+                "remaining_requests": Profiler._remaining,
+                "active_requests": Profiler._active,
+                "samples": sum(Profiler._stacks.values()),
+                "last_dump": Profiler.last_dump,
+            }
+
+    @staticmethod
+    @asynccontextmanager
+    async def request():
+        with Profiler._lock:
+            if Profiler._remaining <= 0:
+                profiled = False
+            else:
+                profiled = True
+                Profiler._remaining -= 1
+                Profiler._active += 1
+                if Profiler._thread is None:
+                    Profiler._stop.clear()
+                    Profiler._thread = threading.Thread(target=Profiler._sample, name="profiler", daemon=True)
+                    Profiler._thread.start()
+        try:
+            yield
+        finally:
+            if profiled:
+                await asyncio.get_running_loop().run_in_executor(None, Profiler._finish_request)
+
+    @staticmethod
+    def _finish_request():
+        # Блокирующая: ждёт поток сэмплирования и пишет файл — вызывать вне цикла событий
+        with Profiler._lock:
+            Profiler._active -= 1
+            if Profiler._active > 0 or Profiler._remaining > 0:
+                return
+            thread, Profiler._thread = Profiler._thread, None
+            Profiler._stop.set()
+        if thread is not None:
+            thread.join()
+        Profiler._dump()
+
+    @staticmethod
+    def _sample():
+        own = threading.get_ident()
+        while not Profiler._stop.wait(Config.PROFILE_INTERVAL):
+            frames = sys._current_frames()
+            batch = []
+            for thread_id, frame in frames.items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                batch.append(";".join(reversed(stack)))
+            with Profiler._lock:
+                Profiler._stacks.update(batch)
+
+    @staticmethod
+    def _dump():
+        with Profiler._lock:
+            stacks, Profiler._stacks = Profiler._stacks, Counter()
+        try:
+            os.makedirs(Config.TRACE_DIR, exist_ok=True)
+            path = os.path.join(Config.TRACE_DIR, f"profile-{int(time.time())}.folded")
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            Profiler.last_dump = path
+            logger.info(f"🔬 Профиль сохранён: {path} ({sum(stacks.values())} сэмплов)")
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения профиля: {e}")
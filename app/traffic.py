@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from app.config import Config
+from app.rate_limiter import RateLimiter
+from app.shared_state import SharedState
+
+logger = logging.getLogger(__name__)
+
+
+class _Turn:
+    """Вызов LLM, заранее зарезервированный этапом фоновой задачи."""
+
+    def __init__(self):
+        self.used = False
+
+
+_background: ContextVar[bool] = ContextVar("background_traffic", default=False)
+_turn: ContextVar[Optional[_Turn]] = ContextVar("background_turn", default=None)
+
+
+class Traffic:
+    """
+    Живые запросы пользователей и фоновая работа (прогрев кэша).
+    → живые запросы учитываются счётчиком каждого воркера в общем хранилище,
+      фоновые задачи ждут простоя всего сервиса, а не только своего процесса
+    → фоновые вызовы LLM расходуют свой бюджет WARMER_RATE_LIMIT_RPM, общий для всех воркеров:
+      каждый вызов резервирует токен до обращения к провайдеру.
+      Этап фоновой задачи асинхронно ждёт простоя и резервирует вызов заранее —
+      так ожидание обычно не занимает потоки пула, нужные живым запросам;
+      остальные вызовы этапа ждут своей очереди в потоке.
+    """
+
+    _lock = threading.Lock()
+    _live = 0
+    _last_live_at = 0.0
+
+    # ================================================================
+    # LIVE
+    # ================================================================
+    @staticmethod
+    @contextmanager
+    def live():
+        with Traffic._lock:
+            Traffic._live += 1
+            Traffic._publish()
+        try:
+            yield
+        finally:
+            with Traffic._lock:
+                Traffic._live -= 1
+                Traffic._last_live_at = time.time()
+                Traffic._publish()
+
+    @staticmethod
+    def idle(quiet_seconds: float = 0) -> bool:
+        """
+        Ни у одного воркера нет живых запросов, и последний завершился не менее quiet_seconds назад.
+        Записи воркеров, не обновлявшиеся дольше JOB_STALE_SECONDS, считаются зависшими.
+        """
+        now = time.time()
+        try:
+            live, last_live_at = SharedState.connection().execute(
+                "SELECT COALESCE(SUM(live), 0), COALESCE(MAX(last_live_at), 0) FROM live_traffic "
+                "WHERE updated_at >= ?",
+                (now - Config.JOB_STALE_SECONDS,)
+            ).fetchone()
+        except Exception as e:
+            logger.error(f"❌ Ошибка чтения живого трафика: {e}")
+            return False
+        return live == 0 and now - last_live_at >= quiet_seconds
+
+    @staticmethod
+    def _publish():
+        # Вызывать под Traffic._lock
+        try:
+            SharedState.connection().execute(
+                "INSERT INTO live_traffic (worker, live, last_live_at, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(worker) DO UPDATE SET live = excluded.live, "
+                "last_live_at = excluded.last_live_at, updated_at = excluded.updated_at",
+                (f"{socket.gethostname()}:{os.getpid()}", Traffic._live, Traffic._last_live_at, time.time())
+            )
+        except Exception as e:
+            logger.error(f"❌ Ошибка учёта живого трафика: {e}")
+
+    # ================================================================
+    # BACKGROUND
+    # ================================================================
+    @staticmethod
+    @contextmanager
+    def background():
+        token = _background.set(True)
+        try:
+            yield
+        finally:
+            _background.reset(token)
+
+    @staticmethod
+    def is_background() -> bool:
+        return _background.get()
+
+    @staticmethod
+    async def wait_turn():
+        """
+        Перед этапом фоновой задачи: ждёт простоя и резервирует вызов LLM.
+        Вызов, не потраченный предыдущим этапом (например, ответ нашёлся в кэше), переходит к следующему.
+        """
+        turn = _turn.get()
+        if turn is not None and not turn.used:
+            return
+        loop = asyncio.get_running_loop()
+        # Проверка пишет в общее хранилище — не в цикле событий
+        while not await loop.run_in_executor(None, Traffic._ready):
+            await asyncio.sleep(Config.WARMER_POLL_INTERVAL)
+        _turn.set(_Turn())
+
+    @staticmethod
+    def take_turn():
+        """
+        Перед каждым фоновым вызовом LLM: тратит вызов, зарезервированный этапом,
+        или ждёт в потоке простоя и свободного токена.
+        """
+        turn = _turn.get()
+        if turn is not None:
+            with Traffic._lock:
+                if not turn.used:
+                    turn.used = True
+                    return
+        while not Traffic._ready():
+            time.sleep(Config.WARMER_POLL_INTERVAL)
+
+    @staticmethod
+    def _ready() -> bool:
+        """Сервис простаивает, и из фонового бюджета удалось списать вызов."""
+        return Traffic.idle(Config.WARMER_IDLE_SECONDS) and Traffic._reserve()
+
+    @staticmethod
+    def _reserve() -> bool:
+        rate = Config.WARMER_RATE_LIMIT_RPM
+        return rate <= 0 or RateLimiter.take(RateLimiter.WARMER, rate) <= 0
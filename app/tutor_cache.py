@@ -0,0 +1,181 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, FrozenSet, NamedTuple, Optional, Set, Tuple
+
+from app.config import Config
+from app.library import CourseLibrary
+
+logger = logging.getLogger(__name__)
+
+
+class TutorCacheEntry(NamedTuple):
+    answer: str
+    stems: FrozenSet[str]
+    guard: Tuple[FrozenSet[str], str]
+    created_at: float
+
+
+class TutorCache:
+    """
+    Кэш ответов репетитора в памяти процесса.
+    → ключ: хэш контекста курса (изменился курс — старые ответы не находятся
+      и вытесняются по LRU/TTL) + нормализованный вопрос
+    → нормализация: регистр, ё/е, пунктуация, пробелы, стоп-слова
+    → если точного совпадения нет, ищется похожий вопрос того же курса:
+      доля общих слов (после отбрасывания окончаний) не ниже TUTOR_CACHE_SIMILARITY,
+      при этом отрицания, вопросительные слова, числа и формулы должны совпадать точно
+    → LRU на TUTOR_CACHE_SIZE ответов, срок жизни TUTOR_CACHE_TTL
+    """
+
+    # Служебные слова и вежливые обороты, не меняющие смысл вопроса.
+    # Отрицания и вопросительные слова («не», «как», «почему»…) намеренно оставлены
+    STOP_WORDS = {
+        "а", "и", "в", "во", "на", "с", "со", "к", "ко", "у", "о", "об", "от", "до", "из", "за", "по",
+        "про", "для", "при", "же", "ли", "бы", "то", "ну", "вот", "ведь", "уж", "это", "этот", "эта",
+        "эти", "мне", "меня", "мы", "я", "ты", "вы", "нам", "нас", "пожалуйста", "плиз", "можно",
+        "можешь", "можете", "объясни", "объясните", "расскажи", "расскажите", "подскажи",
+        "подскажите", "скажи", "скажите", "поясни", "поясните", "такое", "просто", "кратко",
+    }
+
+    # Слова, которые переворачивают смысл: похожие вопросы совпадают, только если эти слова в них одни и те же
+    GUARD_WORDS = {
+        "не", "ни", "нет", "без", "что", "как", "почему", "зачем", "когда", "где", "кто", "какой",
+        "какая", "какие", "сколько", "чем", "отличие", "отличается", "разница",
+    }
+
+    # Знаки препинания, которые не считаются частью формулы
+    PROSE_PUNCTUATION = set(".,!?;:«»\"'…—–")
+
+    _lock = threading.Lock()
+    _entries: "OrderedDict[Tuple[str, str], TutorCacheEntry]" = OrderedDict()
+    _by_course: Dict[str, Set[str]] = {}
+    _stats = Counter()
+
+    # ================================================================
+    # KEYS
+    # ================================================================
+    @staticmethod
+    def course_key(context: str) -> str:
+        return hashlib.sha256(context.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def normalize_question(question: str) -> str:
+        text = question.casefold().replace("ё", "е")
+        text = re.sub(r"[^\w\s]", " ", text)
+        return " ".join(w for w in text.split() if w not in TutorCache.STOP_WORDS)
+
+    @staticmethod
+    def _guard(question: str, normalized: str) -> Tuple[FrozenSet[str], str]:
+        """
+        Части вопроса, которые должны совпасть буквально: смысловые слова из GUARD_WORDS
+        и «формула» — все символы вопроса, кроме кириллицы, пробелов и знаков препинания
+        (x^2 ≠ x^3, sin ≠ cos, 1/n ≠ 1/n^2).
+        """
+        words = frozenset(w for w in normalized.split() if w in TutorCache.GUARD_WORDS)
+        formula = "".join(
+            ch for ch in question.casefold()
+            if not ch.isspace() and ch not in TutorCache.PROSE_PUNCTUATION and not ("а" <= ch <= "я" or ch == "ё")
+        )
+        return words, formula
+
+    @staticmethod
+    def _stems(normalized: str) -> FrozenSet[str]:
+        return frozenset(CourseLibrary.stem(w) for w in normalized.split())
+
+    @staticmethod
+    def _similarity(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+        if not a or not b:
+            return 0.0
+        return len(a & b) / len(a | b)
+
+    # ================================================================
+    # PUBLIC
+    # ================================================================
+    @staticmethod
+    def get(course_key: str, question: str) -> Optional[str]:
+        if not Config.TUTOR_CACHE_ENABLED:
+            return None
+
+        normalized = TutorCache.normalize_question(question)
+        if not normalized:
+            return None
+        now = time.time()
+        guard = TutorCache._guard(question, normalized)
+        with TutorCache._lock:
+            # Нормализация убирает операторы («x+2» и «x-2» → «x 2»), поэтому формулу сверяем и здесь
+            entry = TutorCache._entries.get((course_key, normalized))
+            if entry is not None and now - entry.created_at < Config.TUTOR_CACHE_TTL and entry.guard == guard:
+                TutorCache._entries.move_to_end((course_key, normalized))
+                TutorCache._stats["hits"] += 1
+                return entry.answer
+
+            stems = TutorCache._stems(normalized)
+            best_key, best_score = None, 0.0
+            for candidate in TutorCache._by_course.get(course_key, ()):
+                cached = TutorCache._entries[(course_key, candidate)]
+                if now - cached.created_at >= Config.TUTOR_CACHE_TTL or cached.guard != guard:
+                    continue
+                score = TutorCache._similarity(stems, cached.stems)
+                if score > best_score:
+                    best_key, best_score = (course_key, candidate), score
+
+            if best_key is not None and best_score >= Config.TUTOR_CACHE_SIMILARITY:
+                TutorCache._entries.move_to_end(best_key)
+                TutorCache._stats["similar_hits"] += 1
+                logger.info(f"♻ Похожий вопрос ({best_score:.2f}): '{best_key[1]}'")
+                return TutorCache._entries[best_key].answer
+
+            TutorCache._stats["misses"] += 1
+            return None
+
+    @staticmethod
+    def put(course_key: str, question: str, answer: str):
+        if not Config.TUTOR_CACHE_ENABLED:
+            return
+
+        normalized = TutorCache.normalize_question(question)
+        if not normalized:
+            return
+        key = (course_key, normalized)
+        with TutorCache._lock:
+            TutorCache._entries[key] = TutorCacheEntry(
+                answer,
+                TutorCache._stems(normalized),
+                TutorCache._guard(question, normalized),
+                time.time(),
+            )
+            TutorCache._entries.move_to_end(key)
+            TutorCache._by_course.setdefault(course_key, set()).add(normalized)
+
+            while len(TutorCache._entries) > Config.TUTOR_CACHE_SIZE:
+                old_key, _ = TutorCache._entries.popitem(last=False)
+                TutorCache._forget(old_key)
+                TutorCache._stats["evictions"] += 1
+
+    @staticmethod
+    def stats() -> dict:
+        with TutorCache._lock:
+            hits = TutorCache._stats["hits"] + TutorCache._stats["similar_hits"]
+            lookups = hits + TutorCache._stats["misses"]
+            return {
+                "size": len(TutorCache._entries),
+                "hits": TutorCache._stats["hits"],
+                "similar_hits": TutorCache._stats["similar_hits"],
+                "misses": TutorCache._stats["misses"],
+                "evictions": TutorCache._stats["evictions"],
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            }
+
+    @staticmethod
+    def _forget(key: Tuple[str, str]):
+        # Вызывать под TutorCache._lock
+        course_key, normalized = key
+        questions = TutorCache._by_course.get(course_key)
+        if questions is not None:
+            questions.discard(normalized)
+            if not questions:
+                del TutorCache._by_course[course_key]
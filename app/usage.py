@@ -0,0 +1,184 @@
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from app.config import Config
+from app.shared_state import SharedState
+
+logger = logging.getLogger(__name__)
+
+
+class UsageScope:
+    """
+    Расход токенов в рамках одного запроса или одного курса — по агентам.
+    Объект общий для всех потоков и задач, запущенных из этого контекста.
+    scope_id при генерации курса заменяется на его course_id.
+    """
+
+    def __init__(self, endpoint: str, token_budget: int = 0, time_budget: float = 0):
+        self.scope_id = uuid.uuid4().hex
+        self.endpoint = endpoint
+        self.token_budget = token_budget
+        self.time_budget = time_budget
+        self.started_at = time.time()
+        self.agents: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, agent: str, prompt_tokens: int, completion_tokens: int, cached: bool):
+        with self._lock:
+            stats = self.agents.setdefault(agent, {
+                "calls": 0, "cached_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0
+            })
+            stats["calls"] += 1
+            if cached:
+                stats["cached_calls"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            stats["completion_tokens"] += completion_tokens
+            stats["total_tokens"] += prompt_tokens + completion_tokens
+
+    def _sum(self, field: str) -> int:
+        with self._lock:
+            return sum(stats[field] for stats in self.agents.values())
+
+    @property
+    def total_tokens(self) -> int:
+        return self._sum("total_tokens")
+
+    @property
+    def elapsed(self) -> float:
+        return time.time() - self.started_at
+
+    def exhausted(self) -> bool:
+        if self.token_budget and self.total_tokens >= self.token_budget:
+            return True
+        if self.time_budget and self.elapsed >= self.time_budget:
+            return True
+        return False
+
+    def low(self) -> bool:
+        """Бюджет почти израсходован (BUDGET_LOW_RATIO) — пора экономить."""
+        ratio = Config.BUDGET_LOW_RATIO
+        if self.token_budget and self.total_tokens >= self.token_budget * ratio:
+            return True
+        if self.time_budget and self.elapsed >= self.time_budget * ratio:
+            return True
+        return False
+
+    def summary(self) -> dict:
+        with self._lock:
+            agents = {name: dict(stats) for name, stats in self.agents.items()}
+        return {
+            "scope_id": self.scope_id,
+            "endpoint": self.endpoint,
+            "duration": round(self.elapsed, 3),
+            "calls": sum(s["calls"] for s in agents.values()),
+            "cached_calls": sum(s["cached_calls"] for s in agents.values()),
+            "prompt_tokens": sum(s["prompt_tokens"] for s in agents.values()),
+            "completion_tokens": sum(s["completion_tokens"] for s in agents.values()),
+            "total_tokens": sum(s["total_tokens"] for s in agents.values()),
+            "agents": agents,
+        }
+
+    def headers(self) -> dict:
+        summary = self.summary()
+        return {
+            "X-Usage-Tokens": str(summary["total_tokens"]),
+            "X-Usage-Prompt-Tokens": str(summary["prompt_tokens"]),
+            "X-Usage-Completion-Tokens": str(summary["completion_tokens"]),
+            "X-Usage-Calls": str(summary["calls"]),
+        }
+
+
+_current_scope: ContextVar[Optional[UsageScope]] = ContextVar("usage_scope", default=None)
+
+
+class Usage:
+    """
+    Учёт токенов: каждый вызов LLM записывается в текущий UsageScope,
+    итоги по агентам сохраняются в общее хранилище при закрытии scope.
+    """
+
+    @staticmethod
+    @contextmanager
+    def scope(endpoint: str, token_budget: int = 0, time_budget: float = 0):
+        usage = UsageScope(endpoint, token_budget, time_budget)
+        token = _current_scope.set(usage)
+        try:
+            yield usage
+        finally:
+            _current_scope.reset(token)
+            summary = usage.summary()
+            logger.info(
+                f"💰 [{endpoint}] Расход: {summary['total_tokens']} токенов, "
+                f"{summary['calls']} вызовов ({summary['cached_calls']} из кэша) за {summary['duration']:.1f} сек"
+            )
+            Usage._persist(usage)
+
+    @staticmethod
+    def current() -> Optional[UsageScope]:
+        return _current_scope.get()
+
+    @staticmethod
+    def record(agent: str, response_usage=None, cached: bool = False):
+        usage = _current_scope.get()
+        if usage is None:
+            return
+        prompt_tokens = getattr(response_usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(response_usage, "completion_tokens", 0) or 0
+        usage.record(agent, prompt_tokens, completion_tokens, cached)
+
+    @staticmethod
+    def budget_exhausted() -> bool:
+        usage = _current_scope.get()
+        return usage is not None and usage.exhausted()
+
+    @staticmethod
+    def budget_low() -> bool:
+        usage = _current_scope.get()
+        return usage is not None and usage.low()
+
+    # ================================================================
+    # PERSISTENCE
+    # ================================================================
+    @staticmethod
+    def _persist(usage: UsageScope):
+        try:
+            now = time.time()
+            SharedState.connection().executemany(
+                "INSERT INTO usage_log (scope_id, endpoint, agent, calls, cached_calls, prompt_tokens, "
+                "completion_tokens, total_tokens, duration, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (usage.scope_id, usage.endpoint, agent, s["calls"], s["cached_calls"], s["prompt_tokens"],
+                     s["completion_tokens"], s["total_tokens"], usage.elapsed, now)
+                    for agent, s in usage.summary()["agents"].items()
+                ]
+            )
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения расхода токенов: {e}")
+
+    @staticmethod
+    def report(since: float = 0) -> dict:
+        """
+        Сводка сохранённого расхода по эндпоинтам и агентам.
+        """
+        conn = SharedState.connection()
+        fields = "COUNT(DISTINCT scope_id), SUM(calls), SUM(cached_calls), SUM(prompt_tokens), " \
+                 "SUM(completion_tokens), SUM(total_tokens)"
+
+        def rows(group: str) -> dict:
+            result = {}
+            for row in conn.execute(
+                f"SELECT {group}, {fields} FROM usage_log WHERE created_at >= ? GROUP BY {group}",
+                (since,)
+            ):
+                result[row[0]] = {
+                    "scopes": row[1], "calls": row[2], "cached_calls": row[3],
+                    "prompt_tokens": row[4], "completion_tokens": row[5], "total_tokens": row[6],
+                }
+            return result
+
+        return {"by_endpoint": rows("endpoint"), "by_agent": rows("agent")}
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import time
+from contextlib import nullcontext
+from typing import List
+
+from app.config import Config
+from app.course_store import CourseStore
+from app.job_registry import JobRegistry
+from app.library import CourseLibrary
+from app.llm import LLM
+from app.pipeline import CoursePipeline
+from app.shared_state import SharedState
+from app.traffic import Traffic
+from app.usage import Usage
+
+logger = logging.getLogger(__name__)
+
+
+class CacheWarmer:
+    """
+    Фоновый прогрев популярных тем.
+    → каждый запрос курса увеличивает рейтинг темы (с экспоненциальным затуханием)
+    → в простое провайдера темы из топа без свежего курса генерируются заново
+      и попадают в CourseStore и библиотеку, откуда их отдаёт /generate-course
+    → прогрев уступает живым запросам и тратит свой бюджет WARMER_RATE_LIMIT_RPM (общий для всех воркеров)
+    Цикл прогрева в каждый момент выполняет только один воркер.
+    """
+
+    LOCK_KEY = "__warmer__"
+
+    # ================================================================
+    # POPULARITY
+    # ================================================================
+    @staticmethod
+    def record_request(topic: str):
+        topic_key = CourseLibrary.normalize_topic(topic)
+        if not topic_key:
+            return
+
+        now = time.time()
+        conn = SharedState.connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT score, updated_at FROM topic_stats WHERE topic_key = ?",
+                (topic_key,)
+            ).fetchone()
+            score = CacheWarmer._decayed(row[0], row[1], now) + 1 if row else 1.0
+            conn.execute(
+                "INSERT INTO topic_stats (topic_key, topic, score, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(topic_key) DO UPDATE SET topic = excluded.topic, score = excluded.score, "
+                "updated_at = excluded.updated_at",
+                (topic_key, topic, score, now)
+            )
+            conn.execute("COMMIT")
+        except Exception as e:
+            conn.execute("ROLLBACK")
+            logger.error(f"❌ Ошибка учёта популярности темы: {e}")
+
+    @staticmethod
+    def _decayed(score: float, updated_at: float, now: float) -> float:
+        return score * 0.5 ** ((now - updated_at) / Config.WARMER_HALF_LIFE)
+
+    @staticmethod
+    def candidates() -> List[str]:
+        """
+        Темы из топа по рейтингу, для которых в библиотеке нет курса
+        или он старше WARMER_REFRESH_SECONDS. Тема, которую уже прогревали
+        за этот срок (в том числе неудачно), повторно не берётся.
+        """
+        now = time.time()
+        rows = SharedState.connection().execute(
+            "SELECT topic, score, updated_at, warmed_at FROM topic_stats ORDER BY score DESC LIMIT ?",
+            (Config.WARMER_TOP_TOPICS * 3,)
+        ).fetchall()
+
+        ranked = sorted(
+            ((CacheWarmer._decayed(score, updated_at, now), topic, warmed_at)
+             for topic, score, updated_at, warmed_at in rows),
+            reverse=True
+        )[:Config.WARMER_TOP_TOPICS]
+
+        result = []
+        for score, topic, warmed_at in ranked:
+            if score < Config.WARMER_MIN_SCORE:
+                break
+            if warmed_at and now - warmed_at < Config.WARMER_REFRESH_SECONDS:
+                continue
+            latest = CourseLibrary.latest(topic)
+            if latest is not None and now - latest[1] < Config.WARMER_REFRESH_SECONDS:
+                continue
+            if JobRegistry.is_running(CourseStore.normalize_topic(topic)):
+                continue
+            result.append(topic)
+        return result
+
+    # ================================================================
+    # SCHEDULER
+    # ================================================================
+    @staticmethod
+    async def run():
+        logger.info(f"🔥 Фоновый прогрев запущен: каждые {Config.WARMER_INTERVAL:.0f} сек в простое")
+        while True:
+            await asyncio.sleep(Config.WARMER_INTERVAL)
+            try:
+                await CacheWarmer.warm_once()
+            except Exception as e:
+                logger.error(f"❌ Ошибка фонового прогрева: {e}")
+
+    @staticmethod
+    async def warm_once() -> int:
+        """Один цикл прогрева. Возвращает число прогретых тем."""
+        if not Traffic.idle(Config.WARMER_IDLE_SECONDS) or not LLM.available():
+            return 0
+        if not JobRegistry.acquire(CacheWarmer.LOCK_KEY):
+            return 0
+
+        warmed = 0
+        try:
+            for topic in CacheWarmer.candidates():
+                if not Traffic.idle(Config.WARMER_IDLE_SECONDS) or not LLM.available():
+                    break
+                # Цикл длится часами — продлеваем блокировку, иначе её перехватит другой воркер
+                JobRegistry.touch(CacheWarmer.LOCK_KEY)
+                if await CacheWarmer.warm_topic(topic):
+                    warmed += 1
+        finally:
+            JobRegistry.release(CacheWarmer.LOCK_KEY)
+        return warmed
+
+    @staticmethod
+    async def warm_topic(topic: str) -> bool:
+        # Свой ключ задачи: живой запрос той же темы не ждёт прогрев, который ему уступает
+        job_key = f"warm:{CourseStore.normalize_topic(topic)}"
+        if not JobRegistry.acquire(job_key):
+            return False
+
+        logger.info(f"🔥 Прогрев темы '{topic}'")
+        SharedState.connection().execute(
+            "UPDATE topic_stats SET warmed_at = ? WHERE topic_key = ?",
+            (time.time(), CourseLibrary.normalize_topic(topic))
+        )
+
+        course_id = None
+        previous = CourseLibrary.latest(topic)
+        try:
+            # Бюджет времени не применяем: прогрев большую часть времени ждёт своей очереди
+            # Обновление устаревшего курса не должно собираться из тех же ответов LLM-кэша
+            fresh = LLM.fresh() if previous is not None else nullcontext()
+            with Traffic.background(), fresh, Usage.scope("warmer", Config.COURSE_TOKEN_BUDGET) as usage:
+                course = await CoursePipeline.generate(topic)
+                course_id, _, _ = CourseStore.save(course)
+                usage.scope_id = course_id
+
+            CourseLibrary.add(course)
+            # Обновлённый курс заменяет прежний; курс с fallback-контентом в библиотеку не попадает
+            current = CourseLibrary.latest(topic)
+            if previous is not None and current is not None and current[0] == course_id:
+                CourseLibrary.remove(previous[0])
+            logger.info(f"🔥 Тема '{topic}' прогрета: {course_id}")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Прогрев темы '{topic}' не удался: {e}")
+            return False
+        finally:
+            JobRegistry.release(job_key, course_id)
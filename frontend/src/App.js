@@ -12,10 +12,10 @@ function App() {
   const [isTutorOpen, setIsTutorOpen] = useState(false);
   const [currentLesson, setCurrentLesson] = useState(null);
 
-  const handleGenerateCourse = async (topic) => {
+  const handleGenerateCourse = async (topic, forceNew = false) => {
     setIsLoading(true);
     try {
-      const generatedCourse = await courseAPI.generateCourse(topic);
+      const generatedCourse = await courseAPI.generateCourseOutline(topic, forceNew);
       setCourse(generatedCourse);
     } catch (error) {
       alert('Ошибка при генерации курса. Попробуйте еще раз.');
@@ -25,6 +25,18 @@ function App() {
     }
   };
 
+  const handleOpenCourse = async (courseId) => {
+    setIsLoading(true);
+    try {
+      setCourse(await courseAPI.getCourseOutline(courseId));
+    } catch (error) {
+      alert('Не удалось открыть курс из библиотеки.');
+      console.error('Error opening course:', error);
+    } finally {
+      setIsLoading(false);
+    }
+  };
+
   const handleAskTutor = (lesson) => {
     setCurrentLesson(lesson);
     setIsTutorOpen(true);
@@ -33,10 +45,19 @@ function App() {
   const getCourseContext = () => {
     if (!course) return {};
 
+    // Для репетитора достаточно сводок глав — полный текст уроков не нужен
+    const content = course.chapters
+      ? course.chapters.map(chapter => ({
+          chapter_title: chapter.chapter_title,
+          key_points: chapter.key_points,
+          content: chapter.excerpt
+        }))
+      : course.content;
+
     return {
       title: course.skeleton.title,
       description: course.skeleton.description,
-      content: course.content
+      content
     };
   };
 
@@ -46,6 +67,7 @@ function App() {
         {!course && !isLoading && (
           <CourseGenerator
             onCourseGenerated={handleGenerateCourse}
+            onOpenCourse={handleOpenCourse}
             isLoading={isLoading}
           />
         )}
@@ -54,6 +76,13 @@ function App() {
           <LoadingSpinner message="Генерируем ваш курс... Это может занять несколько минут" />
         )}
 
+        {course && !isLoading && course.source === 'library' && (
+          <div className="library-notice">
+            <span>Курс по этой теме уже был в библиотеке и открыт сразу.</span>
+            <button onClick={() => handleGenerateCourse(course.topic, true)}>Сгенерировать заново</button>
+          </div>
+        )}
+
         {course && !isLoading && (
           <CourseViewer
             course={course}
@@ -1,9 +1,35 @@
-import React, { useState } from 'react';
+import React, { useState, useEffect } from 'react';
 import { BookOpen, Sparkles } from 'lucide-react';
+import { courseAPI } from '../services/api';
 import './CourseGenerator.css';
 
-const CourseGenerator = ({ onCourseGenerated, isLoading }) => {
+const CourseGenerator = ({ onCourseGenerated, onOpenCourse, isLoading }) => {
   const [topic, setTopic] = useState('');
+  const [libraryMatches, setLibraryMatches] = useState([]);
+
+  // Поиск готовых курсов в библиотеке по мере ввода темы
+  useEffect(() => {
+    const query = topic.trim();
+    if (query.length < 3) {
+      setLibraryMatches([]);
+      return undefined;
+    }
+
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const matches = await courseAPI.searchLibrary(query);
+        if (!cancelled) setLibraryMatches(matches.slice(0, 5));
+      } catch (error) {
+        if (!cancelled) setLibraryMatches([]);
+      }
+    }, 300);
+
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [topic]);
 
   const handleSubmit = (e) => {
     e.preventDefault();
@@ -33,6 +59,22 @@ const CourseGenerator = ({ onCourseGenerated, isLoading }) => {
           />
         </div>
 
+        {libraryMatches.length > 0 && (
+          <div className="library-matches">
+            <p>Готовые курсы из библиотеки — откроются сразу:</p>
+            <ul>
+              {libraryMatches.map((match) => (
+                <li key={match.course_id}>
+                  <button type="button" onClick={() => onOpenCourse(match.course_id)} disabled={isLoading}>
+                    <strong>{match.title}</strong>
+                    {match.snippet && <span>{match.snippet}</span>}
+                  </button>
+                </li>
+              ))}
+            </ul>
+          </div>
+        )}
+
         <button
           type="submit"
           className="generate-button"
@@ -7,17 +7,65 @@ import 'katex/dist/katex.min.css';
 import katex from "katex";
 import { InlineMath, BlockMath } from 'react-katex';
 import { Book, FileText, CheckCircle, ChevronDown, ChevronRight } from 'lucide-react';
+import { courseAPI } from '../services/api';
 import './CourseViewer.css';
 
 const CourseViewer = ({ course, onAskTutor }) => {
   const [expandedChapters, setExpandedChapters] = useState({});
   const [activeTab, setActiveTab] = useState('content');
   const [selectedAnswers, setSelectedAnswers] = useState({});
+  const [expandedQuizzes, setExpandedQuizzes] = useState({});
+  // Подгруженные по требованию уроки и тесты: { [индекс главы]: данные }
+  const [lessons, setLessons] = useState({});
+  const [quizzes, setQuizzes] = useState({});
+  const [loadErrors, setLoadErrors] = useState({});
+
+  // Курс приходит либо целиком (content/quizzes), либо структурой со сводками глав (chapters)
+  const isLazy = Boolean(course?.chapters);
+  const chapters = isLazy
+    ? course.chapters
+    : (course?.content || []).map((lesson, index) => ({ index, chapter_title: lesson.chapter_title }));
+  const lessonAt = (index) => (isLazy ? lessons[index] : course.content[index]);
+  const quizAt = (index) => (isLazy ? quizzes[index] : course.quizzes[index]);
+
+  const loadPart = async (kind, index) => {
+    const key = `${kind}-${index}`;
+    setLoadErrors(prev => ({ ...prev, [key]: false }));
+    try {
+      if (kind === 'lesson') {
+        const lesson = await courseAPI.getLesson(course.course_id, index);
+        setLessons(prev => ({ ...prev, [index]: lesson }));
+      } else {
+        const quiz = await courseAPI.getQuiz(course.course_id, index);
+        setQuizzes(prev => ({ ...prev, [index]: quiz }));
+      }
+    } catch (error) {
+      console.error(`Error loading ${kind} ${index}:`, error);
+      setLoadErrors(prev => ({ ...prev, [key]: true }));
+    }
+  };
 
   const toggleChapter = (chapterIndex) => {
+    const expanding = !expandedChapters[chapterIndex];
     setExpandedChapters(prev => ({ ...prev, [chapterIndex]: !prev[chapterIndex] }));
+    if (expanding && isLazy && !lessons[chapterIndex]) loadPart('lesson', chapterIndex);
   };
 
+  // Полный курс показывает тесты сразу, ленивый — по раскрытию
+  const isQuizExpanded = (chapterIndex) => expandedQuizzes[chapterIndex] ?? !isLazy;
+
+  const toggleQuiz = (chapterIndex) => {
+    const expanding = !isQuizExpanded(chapterIndex);
+    setExpandedQuizzes(prev => ({ ...prev, [chapterIndex]: expanding }));
+    if (expanding && isLazy && !quizzes[chapterIndex]) loadPart('quiz', chapterIndex);
+  };
+
+  const renderPartPlaceholder = (kind, index) => (
+    loadErrors[`${kind}-${index}`]
+      ? <div className="chapter-loading">Не удалось загрузить. <button className="ask-button" onClick={() => loadPart(kind, index)}>Повторить</button></div>
+      : <div className="chapter-loading">Загрузка...</div>
+  );
+
   // --- Безопасный рендер inline ---
     const safeInline = (latex) => {
       try {
@@ -347,20 +395,24 @@ const CourseViewer = ({ course, onAskTutor }) => {
 
       {activeTab === 'content' && (
         <div className="chapters-list">
-          {course.content.map((lesson, index) => (
+          {chapters.map((chapter, index) => (
             <div key={index} className="chapter-card">
               <div className="chapter-header" onClick={() => toggleChapter(index)} role="button" tabIndex={0} onKeyDown={e => { if (e.key === 'Enter') toggleChapter(index); }}>
                 <div className="chapter-title">
                   {expandedChapters[index] ? <ChevronDown size={20} /> : <ChevronRight size={20} />}
-                  <span>{lesson.chapter_title.toLowerCase().startsWith('глава') ? lesson.chapter_title : `Глава ${index + 1}: ${lesson.chapter_title}`}</span>
+                  <span>{chapter.chapter_title.toLowerCase().startsWith('глава') ? chapter.chapter_title : `Глава ${index + 1}: ${chapter.chapter_title}`}</span>
                 </div>
-                <button className="ask-button" onClick={e => { e.stopPropagation(); onAskTutor(lesson); }}>Спросить репетитора</button>
+                <button className="ask-button" onClick={e => { e.stopPropagation(); onAskTutor(lessonAt(index) || chapter); }}>Спросить репетитора</button>
               </div>
               {expandedChapters[index] && (
                 <div className="chapter-content">
                   <div className="lesson-content">
                     <h4>Теоретический материал:</h4>
-                    <div className="content-text"><MarkdownWithLatex content={lesson.content} /></div>
+                    {!lessonAt(index) && renderPartPlaceholder('lesson', index)}
+                    {lessonAt(index) && (lessonAt(index).html
+                      // HTML уже санитизирован и с отрисованными формулами на сервере (LessonRenderer)
+                      ? <div className="content-text prerendered" dangerouslySetInnerHTML={{ __html: lessonAt(index).html }} />
+                      : <div className="content-text"><MarkdownWithLatex content={lessonAt(index).content} /></div>)}
                   </div>
                 </div>
               )}
@@ -371,12 +423,14 @@ const CourseViewer = ({ course, onAskTutor }) => {
 
       {activeTab === 'quizzes' && (
         <div className="chapters-list">
-          {course.quizzes.map((quiz, lessonIndex) => (
+          {chapters.map((chapter, lessonIndex) => (
             <div key={lessonIndex} className="quiz-card">
-              <div className="chapter-title">
-                <CheckCircle size={20} /> <span>Глава {lessonIndex + 1}: {quiz.chapter_title}</span>
+              <div className="chapter-title" onClick={() => toggleQuiz(lessonIndex)} role="button" tabIndex={0} onKeyDown={e => { if (e.key === 'Enter') toggleQuiz(lessonIndex); }}>
+                {isQuizExpanded(lessonIndex) ? <ChevronDown size={20} /> : <ChevronRight size={20} />}
+                <CheckCircle size={20} /> <span>Глава {lessonIndex + 1}: {chapter.chapter_title}</span>
               </div>
-              {quiz.questions.map((q, qIndex) => {
+              {isQuizExpanded(lessonIndex) && !quizAt(lessonIndex) && renderPartPlaceholder('quiz', lessonIndex)}
+              {isQuizExpanded(lessonIndex) && quizAt(lessonIndex) && quizAt(lessonIndex).questions.map((q, qIndex) => {
                 const selected = selectedAnswers?.[lessonIndex]?.[qIndex];
                 const normalize = str => str?.toString().trim().toLowerCase();
                 const isCorrect = normalize(selected) === normalize(q.correct_answer);
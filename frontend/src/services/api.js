@@ -15,6 +15,33 @@ export const courseAPI = {
     return response.data;
   },
 
+  // Только структура курса и сводки глав — уроки и тесты подгружаются отдельно.
+  // source: 'library' — готовый курс из библиотеки, 'generated' — создан заново
+  generateCourseOutline: async (topic, forceNew = false) => {
+    const response = await api.post('/generate-course', { topic, force_new: forceNew }, { params: { view: 'outline' } });
+    return { ...response.data, source: response.headers['x-course-source'] };
+  },
+
+  getCourseOutline: async (courseId) => {
+    const response = await api.get(`/courses/${courseId}/outline`);
+    return { ...response.data, source: 'library' };
+  },
+
+  searchLibrary: async (query) => {
+    const response = await api.get('/library/search', { params: { q: query } });
+    return response.data;
+  },
+
+  getLesson: async (courseId, index) => {
+    const response = await api.get(`/courses/${courseId}/lessons/${index}`);
+    return response.data;
+  },
+
+  getQuiz: async (courseId, index) => {
+    const response = await api.get(`/courses/${courseId}/quizzes/${index}`);
+    return response.data;
+  },
+
   askTutor: async (question, courseContent) => {
     const response = await api.post('/ask-tutor', {
       question,